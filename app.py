@@ -7,8 +7,32 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+import dataclasses
+import functools
+import hashlib
+import itertools
+import json
+import logging
+import marshal
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
+from datetime import date, datetime, timedelta
 from dataclasses import dataclass
+from pathlib import Path
+
+import streamlit.logger
+
+if not st.runtime.exists():
+    # Imported outside `streamlit run` (tests, bench/report workers, publish_dataset):
+    # cache_resource and session calls would log "missing ScriptRunContext" at WARNING
+    streamlit.logger.set_log_level('error')
 
 # ============================================================
 # 1. CONFIGURATION & DESIGN SYSTEM
@@ -60,17 +84,29 @@ st.set_page_config(
 # 2. GOD TIER CSS & TYPOGRAPHY INJECTION
 # ============================================================
 
-def inject_god_tier_styles():
-    """Inject bug-free sophisticated CSS"""
-    
-    st.markdown("""
+# Self-hosted bundle written by build_assets.py, served by Streamlit static serving
+STATIC_DIR = Path(__file__).resolve().parent / 'static'
+STATIC_URL = 'app/static'
+
+CDN_ASSET_LINKS = """
     <link rel="preconnect" href="https://fonts.googleapis.com">
     <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
     <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800;900&family=Noto+Sans+JP:wght@400;500;600;700&display=swap" rel="stylesheet">
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
-    """, unsafe_allow_html=True)
-    
-    st.markdown(f"""
+    """
+
+def asset_links() -> str:
+    """<link> tags for fonts and icons: local hashed bundle if built, CDN otherwise"""
+    try:
+        manifest = json.loads((STATIC_DIR / 'manifest.json').read_text())
+        stylesheets = manifest['stylesheets']
+    except (OSError, ValueError, KeyError):
+        return CDN_ASSET_LINKS
+    return ''.join(f'<link rel="stylesheet" href="{STATIC_URL}/{name}">' for name in stylesheets)
+
+def design_css() -> str:
+    """The design-system <style> block (also embedded in batch reports)"""
+    return f"""
     <style>
         /* ====================================
            GLOBAL RESET & BASE STYLES
@@ -323,153 +359,2039 @@ def inject_god_tier_styles():
             animation: fadeInUp 0.6s ease-out forwards;
         }}
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+@st.cache_resource(show_spinner=False)
+def compiled_styles() -> str:
+    """Asset links + design-system CSS, rendered once per process"""
+    return asset_links() + design_css()
+
+def inject_god_tier_styles():
+    """Inject bug-free sophisticated CSS"""
+    st.markdown(compiled_styles(), unsafe_allow_html=True)
+
+# ============================================================
+# 3. INSTRUMENTATION
+# ============================================================
+
+profile_logger = logging.getLogger('dashboard.profile')
+if not profile_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    profile_logger.addHandler(_handler)
+    profile_logger.setLevel(logging.INFO)
+    profile_logger.propagate = False
+
+class RenderProfiler:
+    """Per-stage wall time, rows touched and chart data bytes for one render
+    
+    Every record is also emitted as a JSON log line on ``dashboard.profile``.
+    """
+    
+    enabled = True
+    
+    def __init__(self, run_id: str = None):
+        self.run_id = run_id or datetime.now().strftime('%Y%m%dT%H%M%S.%f')
+        self.records = []
+        self._open = []
+    
+    @contextmanager
+    def stage(self, name: str, **fields):
+        record = {'stage': name, 'rows': 0, **fields}
+        self._open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['ms'] = round((time.perf_counter() - start) * 1000, 3)
+            self._open.pop()
+            self._emit(record)
+    
+    def touch(self, rows: int):
+        """Count rows read by the innermost open stage"""
+        if self._open:
+            self._open[-1]['rows'] += int(rows)
+    
+    def chart(self, name: str, payload_bytes: int):
+        """Record the bytes of a figure's trace data, the bulk of what is sent to the browser"""
+        self._emit({'stage': f'payload.{name}', 'rows': 0, 'bytes': payload_bytes, 'ms': 0.0})
+    
+    def _emit(self, record: dict):
+        self.records.append(record)
+        profile_logger.info(json.dumps({'event': 'render_stage', 'run': self.run_id, **record},
+                                       ensure_ascii=False, default=str))
+    
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.records, columns=['stage', 'ms', 'rows', 'bytes', 'cache'])
+
+class _NullProfiler:
+    """Disabled profiler: every hook is a constant-time no-op"""
+    
+    enabled = False
+    records = []
+    _null_stage = nullcontext()
+    
+    def stage(self, name: str, **fields):
+        return self._null_stage
+    
+    def touch(self, rows: int):
+        pass
+    
+    def chart(self, name: str, payload_bytes: int):
+        pass
+
+NULL_PROFILER = _NullProfiler()
+
+def active_profiler():
+    """Profiler for the current script run
+    
+    Kept on the session's script thread rather than in module globals: cached
+    DataManagers outlive the rerun whose namespace defined them.
+    """
+    return getattr(threading.current_thread(), 'dashboard_profiler', NULL_PROFILER)
+
+def set_active_profiler(profiler):
+    threading.current_thread().dashboard_profiler = profiler
+
+def profiling_requested() -> bool:
+    """?debug=1 opens the panel; DASHBOARD_PROFILE=1 logs every render"""
+    return st.query_params.get('debug') == '1' or os.environ.get('DASHBOARD_PROFILE') == '1'
 
 # ============================================================
-# 3. DATA MANAGER
+# 4. DATA MANAGER
 # ============================================================
 
+class LRUCache:
+    """Thread-safe bounded LRU memo with hit/miss counters
+    
+    Bounded by entry count and, when ``weigh`` is given, by total weight
+    (e.g. bytes) across entries.
+    """
+    
+    def __init__(self, maxsize: int = 128, max_weight: int = None, weigh=None):
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+    
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            if key in self._entries:
+                self.weight -= self._weigh(self._entries[key])
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self.weight += self._weigh(value)
+            while self._entries and (
+                len(self._entries) > self.maxsize
+                or (self.max_weight is not None and self.weight > self.max_weight)
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self.weight -= self._weigh(evicted)
+        return value
+    
+    def _weigh(self, value) -> int:
+        return self.weigh(value) if self.weigh else 0
+    
+    def invalidate(self, predicate=None):
+        """Drop every entry, or only those whose key matches predicate"""
+        with self._lock:
+            if predicate is None:
+                self._entries.clear()
+                self.weight = 0
+            else:
+                for key in [k for k in self._entries if predicate(k)]:
+                    self.weight -= self._weigh(self._entries.pop(key))
+    
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'weight': self.weight
+            }
+
+def _freeze(value):
+    """Make list/set/array arguments hashable for cache keys"""
+    if isinstance(value, (list, tuple, set, frozenset, np.ndarray)):
+        return tuple(sorted(value))
+    return value
+
+def memoized_query(method):
+    """Memoize a DataManager getter per (method, args) in its aggregate cache"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, tuple(_freeze(a) for a in args),
+               tuple(sorted((k, _freeze(v)) for k, v in kwargs.items())))
+        with active_profiler().stage(f'dm.{method.__name__}', cache='hit') as record:
+            def compute():
+                if record is not None:
+                    record['cache'] = 'miss'
+                return method(self, *args, **kwargs)
+            return self.cache.get_or_compute(key, compute)
+    return wrapper
+
+VISIT_SCHEMA = {
+    'date': 'datetime64[us]',
+    'clinic_id': 'int16',
+    'segment': pd.CategoricalDtype(['lifestyle', 'acute', 'checkup']),
+    'visit_type': pd.CategoricalDtype(['初診', '再診', '検診']),
+    'age': 'int8',
+    'revenue': 'int32',
+    'hour': 'int8',
+    'weekday': 'int8',
+    'wait_time': 'int16',
+    'patient_id': 'int32'
+}
+
+# patient_id of visits whose source carries no patient identity
+PATIENT_UNKNOWN = -1
+
+def apply_visit_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast a visit table to the compact columnar schema"""
+    return df.astype({col: dtype for col, dtype in VISIT_SCHEMA.items() if col in df.columns})
+
+def frame_from_parts(parts: list) -> pd.DataFrame:
+    """Concatenate per-shard/per-chunk column arrays into one visit table
+    
+    Categorical columns arrive as integer codes in VISIT_SCHEMA order.
+    """
+    columns = {col: np.concatenate([p[col] for p in parts]) for col in parts[0]}
+    for col in ('segment', 'visit_type'):
+        columns[col] = pd.Categorical.from_codes(columns[col], dtype=VISIT_SCHEMA[col])
+    return pd.DataFrame(columns)
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """Print and return per-column memory usage in bytes"""
+    usage = df.memory_usage(index=True, deep=True)
+    report = pd.DataFrame({
+        'dtype': [str(df.index.dtype)] + [str(df[c].dtype) for c in df.columns],
+        'bytes': usage.values
+    }, index=usage.index)
+    report.loc['TOTAL'] = ['', int(usage.sum())]
+    print(report.to_string())
+    return report
+
+# ------------------------------------------------------------
+# Export ingestion (CSV / Parquet)
+# ------------------------------------------------------------
+
+@dataclass
+class IngestReport:
+    """Row accounting for one export load"""
+    rows_read: int = 0
+    rows_kept: int = 0
+    chunks: int = 0
+    rejected: dict = None
+    
+    def __post_init__(self):
+        self.rejected = self.rejected or {}
+    
+    def reject(self, reason: str, count: int):
+        if count:
+            self.rejected[reason] = self.rejected.get(reason, 0) + int(count)
+
+EXPORT_REQUIRED = ['date', 'segment', 'visit_type', 'age', 'revenue', 'hour']
+EXPORT_OPTIONAL = ['clinic_id', 'weekday', 'wait_time', 'patient_id']
+
+# Valid inclusive ranges for numeric columns
+EXPORT_RANGES = {
+    'age': (0, 120),
+    'revenue': (0, 2**31 - 1),
+    'hour': (0, 23),
+    'clinic_id': (0, 2**15 - 1),
+    'wait_time': (0, 2**15 - 1)
+}
+
+def _iter_export_chunks(path, chunksize: int, columns: list):
+    """Yield raw export chunks of at most chunksize rows"""
+    if str(path).lower().endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("Parquet ingestion requires pyarrow (pip install pyarrow)") from exc
+        parquet = pq.ParquetFile(path)
+        present = [c for c in columns if c in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=present):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=str,
+                               usecols=lambda c: c in columns, encoding='utf-8-sig')
+
+def _intern_patient_ids(keys: pd.Series, registry: dict) -> np.ndarray:
+    """Dense int32 ids for source patient identifiers, stable across chunks
+    
+    Missing identifiers become PATIENT_UNKNOWN.
+    """
+    local, uniques = pd.factorize(keys)
+    ids = np.fromiter((registry.setdefault(key, len(registry)) for key in uniques),
+                      dtype=np.int32, count=len(uniques))
+    return np.append(ids, PATIENT_UNKNOWN)[local]  # factorize codes missing keys as -1
+
+def _coerce_chunk(raw: pd.DataFrame, segment_codes: dict, visit_type_codes: dict,
+                  report: IngestReport, patients: dict) -> dict:
+    """Validate one raw chunk and return compact column arrays of its valid rows"""
+    missing = [c for c in EXPORT_REQUIRED if c not in raw.columns]
+    if missing:
+        raise ValueError(f"Export is missing required columns: {missing}")
+    
+    valid = np.ones(len(raw), dtype=bool)
+    
+    def check(mask, reason):
+        nonlocal valid
+        report.reject(reason, (valid & ~mask).sum())
+        valid &= mask
+    
+    date = pd.to_datetime(raw['date'], errors='coerce').dt.normalize()
+    check(date.notna().to_numpy(), 'date')
+    
+    codes = {}
+    for col, lookup in (('segment', segment_codes), ('visit_type', visit_type_codes)):
+        labels = raw[col].astype(str).str.strip()
+        labels = labels.map(lookup).fillna(labels)
+        labels = labels.where(labels.isin(VISIT_SCHEMA[col].categories))  # unknown -> NaN -> code -1
+        codes[col] = pd.Categorical(labels, dtype=VISIT_SCHEMA[col]).codes
+        check(codes[col] >= 0, col)
+    
+    numbers = {}
+    for col in EXPORT_REQUIRED[3:] + [c for c in EXPORT_OPTIONAL
+                                      if c in raw.columns and c not in ('weekday', 'patient_id')]:
+        values = pd.to_numeric(raw[col], errors='coerce').to_numpy(dtype=float)
+        lo, hi = EXPORT_RANGES[col]
+        check(~np.isnan(values) & (values >= lo) & (values <= hi), col)
+        numbers[col] = values
+    
+    # Sunday is closed; anything dated Sunday is a data-entry error
+    weekday = date.dt.weekday.to_numpy()
+    check(weekday != 6, 'weekday')
+    
+    report.rows_read += len(raw)
+    report.rows_kept += int(valid.sum())
+    report.chunks += 1
+    
+    part = {
+        'date': date.to_numpy()[valid].astype('datetime64[us]'),
+        'clinic_id': (numbers['clinic_id'][valid] if 'clinic_id' in numbers
+                      else np.zeros(int(valid.sum()))).astype(np.int16),
+        'segment': codes['segment'][valid].astype(np.int8),
+        'visit_type': codes['visit_type'][valid].astype(np.int8)
+    }
+    for col in ('age', 'revenue', 'hour', 'wait_time'):
+        if col in numbers:
+            part[col] = numbers[col][valid].astype(VISIT_SCHEMA[col])
+    part['weekday'] = weekday[valid].astype(np.int8)
+    if 'patient_id' in raw.columns:
+        patient_keys = raw['patient_id'].astype('string').str.strip().replace('', pd.NA)
+        part['patient_id'] = _intern_patient_ids(patient_keys[valid], patients)
+    return part
+
+def load_visit_export(path, chunksize: int = 200_000, column_map: dict = None,
+                      segment_codes: dict = None, visit_type_codes: dict = None):
+    """Stream a practice-management export into the visit schema
+    
+    Reads at most ``chunksize`` raw rows at a time; each chunk is renamed via
+    ``column_map`` (source -> schema name), its segment/visit-type codes are
+    mapped to schema labels, and invalid rows are dropped and counted. Only
+    compact typed arrays are retained between chunks.
+    
+    Source patient identifiers (any string, e.g. a chart number) are mapped
+    to dense ``patient_id`` ints in order of first appearance; blank ones, or
+    a missing column, give PATIENT_UNKNOWN.
+    
+    Returns (DataFrame, IngestReport). ``wait_time`` is left out when the
+    export does not carry it, so the caller's wait model can fill it in.
+    """
+    column_map = column_map or {}
+    source_columns = set(column_map) | set(EXPORT_REQUIRED) | set(EXPORT_OPTIONAL)
+    report = IngestReport()
+    patients = {}
+    parts = []
+    
+    for raw in _iter_export_chunks(path, chunksize, list(source_columns)):
+        raw = raw.rename(columns=column_map)
+        parts.append(_coerce_chunk(raw, segment_codes or {}, visit_type_codes or {}, report, patients))
+        del raw
+    
+    if not parts:
+        raise ValueError(f"Export {path} contains no rows")
+    df = frame_from_parts(parts)
+    if not df['date'].is_monotonic_increasing:
+        df = df.take(np.argsort(df['date'].to_numpy(), kind='stable')).reset_index(drop=True)
+    return apply_visit_schema(df), report
+
+# ------------------------------------------------------------
+# Persistent columnar table cache (.npy per column, memory-mapped)
+# ------------------------------------------------------------
+
+TABLE_CACHE_VERSION = 1
+TABLE_CACHE_DIR = Path(__file__).resolve().parent / '.cache' / 'visits'
+# Tables kept per cache directory; new keys (a new end_date, a rewritten export) evict the oldest
+TABLE_CACHE_KEEP = 4
+
+def _schema_stamp() -> str:
+    return json.dumps({col: str(dtype) for col, dtype in VISIT_SCHEMA.items()}, ensure_ascii=False)
+
+def table_cache_key(params: dict) -> str:
+    """Stable key for a dataset's parameters / source fingerprint"""
+    payload = json.dumps({'params': params, 'version': TABLE_CACHE_VERSION, 'schema': _schema_stamp()},
+                         sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+def wait_model_key(model) -> dict:
+    """Process-independent identity of a wait model for cache keys
+    
+    Dataclass models give their class and fields; a function gives its
+    qualified name and a digest of its code. Never a repr, which for a
+    lambda or a plain object embeds a memory address.
+    """
+    cls = type(model)
+    name = f"{cls.__module__}.{cls.__qualname__}"
+    if dataclasses.is_dataclass(model):
+        return {'model': name, 'params': dataclasses.asdict(model)}
+    code = getattr(model, '__code__', None)
+    if code is not None:
+        return {'model': f"{model.__module__}.{model.__qualname__}", 'code': _code_digest(code)}
+    return {'model': name, 'params': {k: v for k, v in sorted(vars(model).items()) if not k.startswith('_')}}
+
+def export_fingerprint(path) -> dict:
+    """Identify an export file by path, size and modification time"""
+    stat = os.stat(path)
+    return {'path': str(Path(path).resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def save_table(df: pd.DataFrame, directory):
+    """Write each column as .npy (categoricals as codes), then publish atomically"""
+    directory = Path(directory)
+    tmp = directory.with_name(f"{directory.name}.tmp-{os.getpid()}")
+    tmp.mkdir(parents=True, exist_ok=True)
+    for col in df.columns:
+        values = df[col].cat.codes if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col]
+        np.save(tmp / f"{col}.npy", values.to_numpy())
+    meta = {'version': TABLE_CACHE_VERSION, 'schema': _schema_stamp(),
+            'columns': list(df.columns), 'rows': len(df)}
+    (tmp / 'meta.json').write_text(json.dumps(meta, ensure_ascii=False))
+    try:
+        os.replace(tmp, directory)
+    except OSError:
+        # Another process published the same key first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def load_table(directory) -> pd.DataFrame:
+    """Memory-map a saved table; None if absent or stamped with another version"""
+    directory = Path(directory)
+    try:
+        meta = json.loads((directory / 'meta.json').read_text())
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != TABLE_CACHE_VERSION or meta.get('schema') != _schema_stamp():
+        return None
+    columns = {}
+    for col in meta['columns']:
+        try:
+            values = np.load(directory / f"{col}.npy", mmap_mode='r')
+        except OSError:
+            return None  # pruned while we were reading it
+        if isinstance(VISIT_SCHEMA.get(col), pd.CategoricalDtype):
+            values = pd.Categorical.from_codes(values, dtype=VISIT_SCHEMA[col])
+        columns[col] = values
+    return pd.DataFrame(columns, copy=False)
+
+def prune_table_cache(cache_dir, keep: int = TABLE_CACHE_KEEP):
+    """Delete all but the ``keep`` most recently used tables in cache_dir
+    
+    Processes that already mapped a deleted table keep reading it; the
+    files go away when the last mapping does.
+    """
+    used = {}
+    for table in Path(cache_dir).iterdir():
+        if '.tmp-' in table.name:
+            continue
+        try:
+            if table.is_dir():
+                used[table] = table.stat().st_mtime
+        except FileNotFoundError:
+            pass  # another process pruned it first
+    for stale in sorted(used, key=used.get, reverse=True)[keep:]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+def cached_table(cache_dir, params: dict, build, keep: int = TABLE_CACHE_KEEP) -> pd.DataFrame:
+    """Load the table for params from cache_dir, building and saving it on a miss
+    
+    A hit marks the table as used; a miss prunes cache_dir to ``keep`` tables
+    after publishing the new one.
+    """
+    directory = Path(cache_dir) / table_cache_key(params)
+    df = load_table(directory)
+    if df is None:
+        df = build()
+        save_table(df, directory)
+        prune_table_cache(cache_dir, keep)
+    else:
+        try:
+            os.utime(directory)
+        except OSError:
+            pass  # pruned by another process; our mapping stays valid
+    return df
+
+# Shared dataset generations: root/gen-NNNNNN/{visits,cube}/ plus a CURRENT pointer
+SHARED_DATASET_DIR = Path('/dev/shm/clinic-dashboard')
+SHARED_CURRENT = 'CURRENT'
+
+def current_generation(root) -> str:
+    """Name of the generation CURRENT points at, or None if nothing is published"""
+    try:
+        return (Path(root) / SHARED_CURRENT).read_text().strip() or None
+    except OSError:
+        return None
+
+def publish_generation(dm, root, keep: int = 2) -> str:
+    """Write dm's table and rollup cube as a new generation and point CURRENT at it
+    
+    Workers memory-map the files read-only (DataManager.from_shared), so on
+    tmpfs such as /dev/shm every process shares one physical copy. Older
+    generations beyond ``keep`` are removed; mappings already open survive.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    previous = current_generation(root)
+    name = f"gen-{int(previous.split('-')[1]) + 1 if previous else 1:06d}"
+    tmp = root / f"{name}.tmp-{os.getpid()}"
+    save_table(dm.data, tmp / 'visits')
+    dm.cube.save(tmp / 'cube')
+    os.replace(tmp, root / name)
+    
+    pointer = root / f"{SHARED_CURRENT}.tmp-{os.getpid()}"
+    pointer.write_text(name)
+    os.replace(pointer, root / SHARED_CURRENT)
+    
+    published = sorted(p for p in root.glob('gen-*') if '.tmp-' not in p.name)
+    for old in published[:-keep]:
+        shutil.rmtree(old, ignore_errors=True)
+    return name
+
+def _slot_size(df: pd.DataFrame, keys: list) -> np.ndarray:
+    """Per-row size of the row's (clinic, *keys) group"""
+    if 'clinic_id' in df.columns:
+        keys = ['clinic_id'] + keys
+    return df.groupby(keys, sort=False, observed=True)['date'].transform('size').to_numpy()
+
+@dataclass
+class DailyLoadWaitModel:
+    """Wait time as a power curve of the day's visit count
+    
+    wait = scale * (load / reference_load) ** exponent, truncated and clipped.
+    The defaults reproduce the original quadratic curve.
+    """
+    reference_load: float = 60
+    scale: float = 35
+    exponent: float = 2.0
+    min_wait: int = 8
+    max_wait: int = 135
+    
+    SLOT = ['date']  # load is counted per clinic and SLOT
+    
+    def load(self, df: pd.DataFrame) -> np.ndarray:
+        return _slot_size(df, self.SLOT)
+    
+    def curve(self, load) -> np.ndarray:
+        """Wait in minutes for a given slot load (any array shape)"""
+        wait = np.trunc((np.asarray(load) / self.reference_load) ** self.exponent * self.scale)
+        return wait.clip(self.min_wait, self.max_wait)
+    
+    def __call__(self, df: pd.DataFrame) -> np.ndarray:
+        return self.curve(self.load(df)).astype(np.int64)
+
+@dataclass
+class HourlyLoadWaitModel(DailyLoadWaitModel):
+    """Same curve driven by the visit count in each (date, hour) slot"""
+    reference_load: float = 12
+    
+    SLOT = ['date', 'hour']
+
+# ------------------------------------------------------------
+# Rollup cube (day × clinic × segment × visit_type × hour)
+# ------------------------------------------------------------
+
+SEGMENT_LABELS = {'lifestyle': '生活習慣病', 'acute': '急性疾患', 'checkup': '検診・ドック'}
+WEEKDAY_LABELS = ['月', '火', '水', '木', '金', '土']
+
+# metric -> (colorbar title, hover value format)
+HEATMAP_METRICS = {
+    'visits': ('来院数', '%{z}人'),
+    'revenue': ('売上', '¥%{z:,.0f}'),
+    'wait_time': ('平均待ち時間', '%{z:.0f}分')
+}
+
+# Fixed 5-year age bins; the last bin is closed on the right
+AGE_BIN_EDGES = np.arange(0, 125, 5)
+
+def age_bin_index(age) -> np.ndarray:
+    """Bin number of each age on AGE_BIN_EDGES (out-of-range ages clamp to the end bins)"""
+    bins = np.searchsorted(AGE_BIN_EDGES, np.asarray(age), side='right') - 1
+    return bins.clip(0, len(AGE_BIN_EDGES) - 2)
+
+# Revisit interval bins (days since the patient's previous visit); the last is open-ended
+REVISIT_BIN_EDGES = np.array([0, 7, 14, 28, 56, 91, 182, 365])
+REVISIT_BIN_LABELS = ['1週未満', '1–2週', '2–4週', '1–2ヶ月', '2–3ヶ月', '3–6ヶ月', '6–12ヶ月', '1年以上']
+
+@dataclass(frozen=True)
+class DateRange:
+    """Half-open span start <= date < end; hashable, so it can key the memo cache"""
+    start: pd.Timestamp
+    end: pd.Timestamp
+    
+    def __post_init__(self):
+        object.__setattr__(self, 'start', pd.Timestamp(self.start))
+        object.__setattr__(self, 'end', pd.Timestamp(self.end))
+        if self.end < self.start:
+            raise ValueError(f"DateRange end {self.end} is before start {self.start}")
+    
+    @classmethod
+    def of(cls, target, months: int = 1) -> 'DateRange':
+        """Normalize a getter target: a DateRange, or a Period (month, quarter, week, ...)
+        
+        ``months`` > 1 widens a Period target to that many periods ending at it.
+        """
+        if isinstance(target, DateRange):
+            if months != 1:
+                raise ValueError("months only applies to Period targets")
+            return target
+        return cls((target - (months - 1)).start_time, (target + 1).start_time)
+    
+    @classmethod
+    def to_date(cls, day, freq: str = 'W') -> 'DateRange':
+        """Period-to-date: start of the freq period containing day, through day"""
+        day = pd.Timestamp(day).normalize()
+        return cls(day.to_period(freq).start_time, day + pd.Timedelta(days=1))
+    
+    def previous(self) -> 'DateRange':
+        """The span immediately before: as many whole months, else as many days"""
+        if all(t == t.normalize() and t.day == 1 for t in (self.start, self.end)):
+            months = (self.end.year - self.start.year) * 12 + self.end.month - self.start.month
+            return DateRange(self.start - pd.DateOffset(months=months), self.start)
+        return DateRange(self.start - (self.end - self.start), self.start)
+    
+    def shift(self, **offset) -> 'DateRange':
+        """Same span moved by a calendar offset, e.g. shift(years=-1)"""
+        delta = pd.DateOffset(**offset)
+        return DateRange(self.start + delta, self.end + delta)
+    
+    def year_ago(self) -> 'DateRange':
+        return self.shift(years=-1)
+    
+    def overlaps(self, other: 'DateRange') -> bool:
+        return self.start < other.end and other.start < self.end
+
+class RollupCube:
+    """Pre-aggregated visit cells backing the dashboard queries
+    
+    ``cells`` has one row per (date, clinic_id, segment, visit_type, hour) with
+    visit count, revenue sum and wait-time sum. Age histograms on AGE_BIN_EDGES
+    are kept per (date, clinic_id, segment) in ``age_cells``/``age_hist``, the
+    finest grain any age query needs. Both are sorted by date so a date range
+    is a binary-search slice.
+    """
+    
+    KEYS = ['date', 'clinic_id', 'segment', 'visit_type', 'hour']
+    
+    def __init__(self, data: pd.DataFrame):
+        day = data['date'].to_numpy()
+        clinic = data['clinic_id'].to_numpy().astype(np.int64)
+        segment = data['segment'].cat.codes.to_numpy().astype(np.int64)
+        visit_type = data['visit_type'].cat.codes.to_numpy().astype(np.int64)
+        hour = data['hour'].to_numpy().astype(np.int64)
+        n_clinics = int(clinic.max()) + 1 if len(clinic) else 1
+        n_seg = len(VISIT_SCHEMA['segment'].categories)
+        n_vt = len(VISIT_SCHEMA['visit_type'].categories)
+        
+        # Integer cell keys ordered by (date, clinic, segment, ...) so np.unique sorts by date
+        day_code, day_idx = np.unique(day, return_inverse=True)
+        seg_key = (day_idx * n_clinics + clinic) * n_seg + segment
+        cell_key = (seg_key * n_vt + visit_type) * 24 + hour
+        
+        keys, cell = np.unique(cell_key, return_inverse=True)
+        rest, cell_hour = np.divmod(keys, 24)
+        rest, cell_vt = np.divmod(rest, n_vt)
+        rest, cell_seg = np.divmod(rest, n_seg)
+        cell_day, cell_clinic = np.divmod(rest, n_clinics)
+        n_cells = len(keys)
+        self.cells = pd.DataFrame({
+            'date': day_code[cell_day],
+            'clinic_id': cell_clinic.astype(np.int16),
+            'segment': pd.Categorical.from_codes(cell_seg, dtype=VISIT_SCHEMA['segment']),
+            'visit_type': pd.Categorical.from_codes(cell_vt, dtype=VISIT_SCHEMA['visit_type']),
+            'hour': cell_hour.astype(np.int8),
+            'weekday': pd.DatetimeIndex(day_code[cell_day]).weekday.to_numpy().astype(np.int8),
+            'visits': np.bincount(cell, minlength=n_cells).astype(np.int32),
+            'revenue': np.bincount(cell, weights=data['revenue'].to_numpy(), minlength=n_cells).astype(np.int32),
+            'wait_sum': np.bincount(cell, weights=data['wait_time'].to_numpy(), minlength=n_cells).astype(np.int32)
+        })
+        
+        n_bins = len(AGE_BIN_EDGES) - 1
+        age_keys, age_cell = np.unique(seg_key, return_inverse=True)
+        rest, age_seg = np.divmod(age_keys, n_seg)
+        age_day, age_clinic = np.divmod(rest, n_clinics)
+        self.age_cells = pd.DataFrame({
+            'date': day_code[age_day],
+            'clinic_id': age_clinic.astype(np.int16),
+            'segment': pd.Categorical.from_codes(age_seg, dtype=VISIT_SCHEMA['segment'])
+        })
+        flat = age_cell * n_bins + age_bin_index(data['age'].to_numpy())
+        self.age_hist = np.bincount(flat, minlength=len(age_keys) * n_bins).reshape(-1, n_bins).astype(np.uint16)
+        
+        self._dates = self.cells['date'].to_numpy()
+        self._age_dates = self.age_cells['date'].to_numpy()
+    
+    @staticmethod
+    def _slice(frame: pd.DataFrame, dates: np.ndarray, start, end, clinic_id):
+        """Positional slice (and optional clinic mask) for start <= date < end"""
+        lo = dates.searchsorted(np.datetime64(pd.Timestamp(start)), side='left')
+        hi = dates.searchsorted(np.datetime64(pd.Timestamp(end)), side='left')
+        rows = slice(lo, hi)
+        if clinic_id is None:
+            return rows
+        ids = frame['clinic_id'].to_numpy()[rows]
+        mask = ids == clinic_id if np.isscalar(clinic_id) else np.isin(ids, list(clinic_id))
+        return np.arange(lo, hi)[mask]
+    
+    def select(self, start, end, clinic_id=None) -> pd.DataFrame:
+        """Cells for start <= date < end, optionally one or more clinics"""
+        return self.cells.iloc[self._slice(self.cells, self._dates, start, end, clinic_id)]
+    
+    def select_ages(self, start, end, clinic_id=None):
+        """(age_cells, age_hist) for start <= date < end"""
+        rows = self._slice(self.age_cells, self._age_dates, start, end, clinic_id)
+        return self.age_cells.iloc[rows], self.age_hist[rows]
+    
+    def replace_from(self, tail: pd.DataFrame):
+        """Rebuild only the cells dated at or after tail's first row
+        
+        ``tail`` must hold every visit from its first date onward.
+        """
+        part = RollupCube(tail)
+        start = np.datetime64(tail['date'].iloc[0])
+        lo = self._dates.searchsorted(start, side='left')
+        age_lo = self._age_dates.searchsorted(start, side='left')
+        self.cells = pd.concat([self.cells.iloc[:lo], part.cells], ignore_index=True)
+        self.age_cells = pd.concat([self.age_cells.iloc[:age_lo], part.age_cells], ignore_index=True)
+        self.age_hist = np.concatenate([self.age_hist[:age_lo], part.age_hist])
+        self._dates = self.cells['date'].to_numpy()
+        self._age_dates = self.age_cells['date'].to_numpy()
+    
+    def save(self, directory):
+        """Write cells, age cells and age histogram as .npy files (see save_table)"""
+        directory = Path(directory)
+        save_table(self.cells, directory / 'cells')
+        save_table(self.age_cells, directory / 'age_cells')
+        np.save(directory / 'age_hist.npy', self.age_hist)
+    
+    @classmethod
+    def load(cls, directory) -> 'RollupCube':
+        """Memory-map a saved cube read-only; None if absent or stale"""
+        directory = Path(directory)
+        cells = load_table(directory / 'cells')
+        age_cells = load_table(directory / 'age_cells')
+        if cells is None or age_cells is None or not (directory / 'age_hist.npy').exists():
+            return None
+        cube = cls.__new__(cls)
+        cube.cells, cube.age_cells = cells, age_cells
+        cube.age_hist = np.load(directory / 'age_hist.npy', mmap_mode='r')
+        cube._dates = cells['date'].to_numpy()
+        cube._age_dates = age_cells['date'].to_numpy()
+        return cube
+    
+    @staticmethod
+    def totals(cells: pd.DataFrame) -> dict:
+        visits = cells['visits'].to_numpy()
+        return {
+            'visits': int(visits.sum()),
+            'revenue': int(cells['revenue'].sum()),
+            'wait_sum': int(cells['wait_sum'].sum()),
+            'first': int(visits[(cells['visit_type'] == '初診').to_numpy()].sum())
+        }
+    
+    def nbytes(self) -> int:
+        frames = self.cells.memory_usage(deep=True).sum() + self.age_cells.memory_usage(deep=True).sum()
+        return int(frames + self.age_hist.nbytes)
+
+class CohortEngine:
+    """First-visit cohorts, monthly retention and revisit intervals
+    
+    One stable sort by patient id over date-ordered visits (two 16-bit radix
+    passes) puts every patient's visits in a contiguous, chronological run.
+    Cohort months, retention cells and revisit gaps then come from run-start
+    masks, np.diff and bincounts over that order, with no per-patient Python.
+    Patients whose first visit in the data is not 初診 were already patients
+    when the data starts (left-censored) and are left out of the cohorts
+    unless ``new_patients_only=False``. PATIENT_UNKNOWN visits are ignored.
+    """
+    
+    def __init__(self, patient_id, dates, visit_type, segment, new_patients_only: bool = True):
+        patient_id = np.asarray(patient_id)
+        day = np.asarray(dates).astype('datetime64[D]').astype(np.int32)
+        visit_type, segment = np.asarray(visit_type), np.asarray(segment)
+        known = patient_id != PATIENT_UNKNOWN
+        if not known.all():
+            patient_id, day, visit_type, segment = (a[known] for a in (patient_id, day, visit_type, segment))
+        if len(day) > 1 and (day[1:] < day[:-1]).any():
+            by_date = np.argsort(day, kind='stable')
+            patient_id, day, visit_type, segment = (a[by_date] for a in (patient_id, day, visit_type, segment))
+        
+        # Month number (0 = first month in the data) via month starts, not a per-row cast
+        bounds = day[[0, -1]] if len(day) else np.zeros(2, dtype=np.int32)
+        first_last = bounds.astype('datetime64[D]').astype('datetime64[M]')
+        month_starts = np.arange(first_last[0], first_last[1] + 1).astype('datetime64[D]').astype(np.int32)
+        self.first_month, n_months = int(first_last[0].astype(np.int64)), len(month_starts)
+        date_month = (np.searchsorted(month_starts, day, side='right') - 1).astype(np.int32)
+        
+        order = self._stable_order(patient_id)
+        patient, run_day, month = patient_id[order], day[order], date_month[order]
+        start = np.ones(len(order), dtype=bool)
+        start[1:] = patient[1:] != patient[:-1]
+        run = np.cumsum(start) - 1
+        first = np.flatnonzero(start)
+        
+        # Retention cells: each patient's first visit in each calendar month
+        cohort = month[first][run]
+        active = start.copy()
+        active[1:] |= month[1:] != month[:-1]
+        if new_patients_only:
+            active &= (visit_type[order][first] == 0)[run]
+        cell = cohort[active].astype(np.int64) * n_months + (month[active] - cohort[active])
+        self.counts = np.bincount(cell, minlength=n_months * n_months).reshape(n_months, n_months)
+        
+        # Revisit gaps, scattered back to date order so a date range is a slice
+        gap = np.full(len(order), -1, dtype=np.int32)
+        gap[1:] = np.where(start[1:], -1, np.diff(run_day))
+        by_visit = np.empty_like(gap)
+        by_visit[order] = gap
+        revisit = by_visit >= 0
+        self._revisit_day = day[revisit]
+        self._gap = by_visit[revisit]
+        self._revisit_segment = segment[revisit].astype(np.int8)
+    
+    @staticmethod
+    def _stable_order(ids: np.ndarray) -> np.ndarray:
+        """Stable argsort of non-negative int32 ids as two LSD radix passes
+        
+        NumPy radix-sorts 16-bit keys; a stable argsort of int32 falls back to
+        a comparison sort that is several times slower.
+        """
+        low = np.argsort((ids & 0xFFFF).astype(np.uint16), kind='stable')
+        high = np.argsort((ids[low] >> 16).astype(np.uint16), kind='stable')
+        return low[high]
+    
+    @property
+    def nbytes(self) -> int:
+        return self.counts.nbytes + self._revisit_day.nbytes + self._gap.nbytes + self._revisit_segment.nbytes
+    
+    def retention(self, months: int = 12, rate: bool = True) -> pd.DataFrame:
+        """Patients seen k months after their first-visit month, per cohort
+        
+        Index: cohort (first-visit month, non-empty cohorts only); columns
+        k = 0..months-1. Cells past the last month in the data are NaN;
+        ``rate`` divides by the cohort size, so column 0 is 1.0.
+        """
+        n = len(self.counts)
+        counts = np.zeros((n, months))
+        width = min(months, n)
+        counts[:, :width] = self.counts[:, :width]
+        counts[np.arange(n)[:, None] + np.arange(months) >= n] = np.nan
+        sizes = self.counts[:, 0] if n else np.zeros(0, dtype=np.int64)
+        if rate:
+            counts /= np.where(sizes > 0, sizes, 1)[:, None]
+        cohorts = pd.period_range(pd.Period(ordinal=self.first_month, freq='M'), periods=n, freq='M')
+        return pd.DataFrame(counts[sizes > 0], index=pd.PeriodIndex(cohorts[sizes > 0], name='cohort'),
+                            columns=pd.RangeIndex(months, name='months_since_first'))
+    
+    def interval_counts(self, start, end) -> np.ndarray:
+        """(segments, REVISIT_BIN_EDGES bins) counts of revisits dated start <= date < end"""
+        bounds = np.array([_epoch_day(start), _epoch_day(end)], dtype=self._revisit_day.dtype)
+        lo, hi = self._revisit_day.searchsorted(bounds)
+        n_seg, n_bins = len(VISIT_SCHEMA['segment'].categories), len(REVISIT_BIN_EDGES)
+        bins = np.searchsorted(REVISIT_BIN_EDGES, self._gap[lo:hi], side='right') - 1
+        flat = self._revisit_segment[lo:hi].astype(np.int64) * n_bins + bins
+        return np.bincount(flat, minlength=n_seg * n_bins).reshape(n_seg, n_bins)
+
 class DataManager:
-    """Sophisticated data generation"""
+    """Sophisticated data generation
+    
+    Data is generated in clinic × month shards, each seeded from its own
+    SeedSequence child, so output is identical for any ``workers`` count.
+    ``workers > 1`` runs shards in a process pool (headless/load-test use).
+    Getters take a month ``pd.Period`` or any ``DateRange``; bounds are found
+    with searchsorted on the date-sorted table, so each lookup is a slice.
+    Getter results are memoized and shared; treat them as read-only.
+    """
+    
+    # Arrival & case-mix model
+    BASE_LAMBDA = 60
+    WEEKDAY_COEF = {0: 1.2, 3: 0.6, 5: 0.6}
+    RAIN_PROB = 0.05
+    RAIN_COEF = 0.8
+    DAILY_MIN, DAILY_MAX = 15, 95
+    
+    SEGMENTS = ['lifestyle', 'acute', 'checkup']
+    SEGMENT_PROB = [0.4, 0.5, 0.1]
+    SEGMENT_PROB_WINTER = [0.35, 0.6, 0.05]
+    WINTER_MONTHS = [12, 1, 2]
+    
+    # segment -> (mean, std, min, max)
+    REVENUE_PARAMS = {
+        'lifestyle': (5000, 1200, 3000, 9000),
+        'acute': (2800, 600, 1800, 5000),
+        'checkup': (16000, 2500, 12000, 22000)
+    }
+    AGE_PARAMS = {
+        'lifestyle': (58, 12),
+        'acute': (40, 18),
+        'checkup': (47, 10)
+    }
+    AGE_MIN, AGE_MAX = 22, 82
     
-    def __init__(self, months_back: int = 6, seed: int = 42):
+    HOURS = [9, 10, 11, 12, 14, 15, 16, 17]
+    HOUR_PROB = [0.08, 0.16, 0.24, 0.09, 0.11, 0.21, 0.08, 0.03]
+    
+    # Patient model: a non-初診 visit returns to a patient whose first visit was
+    # ~Exponential(RETURN_DAYS) days earlier. Patients from before the data
+    # start are bucketed at NEW_PATIENTS_PER_DAY into ids from LEGACY_PATIENT_BASE
+    # (LEGACY_PATIENT_SPAN per clinic × segment; int32 ids leave room for MAX_CLINICS).
+    RETURN_DAYS = {'lifestyle': 180, 'acute': 14, 'checkup': 365}
+    NEW_PATIENTS_PER_DAY = {'lifestyle': 3.6, 'acute': 10.5, 'checkup': 0.6}
+    LEGACY_PATIENT_BASE = 2**30
+    LEGACY_PATIENT_SPAN = 2**20
+    MAX_CLINICS = (2**31 - LEGACY_PATIENT_BASE) // LEGACY_PATIENT_SPAN // len(SEGMENTS)
+    
+    def __init__(self, months_back: int = 6, seed: int = 42, end_date: datetime = None,
+                 cache_size: int = 64, wait_model=None, n_clinics: int = 1, workers: int = 1,
+                 data: pd.DataFrame = None, cache_dir=None, cube: RollupCube = None):
         self.months_back = months_back
-        np.random.seed(seed)
-        self.data = self._generate_data()
+        self.seed = seed
+        self.end_date = end_date or datetime.now()
+        self.wait_model = wait_model or DailyLoadWaitModel()
+        self.n_clinics = n_clinics
+        self.workers = workers
+        self.cache = LRUCache(maxsize=cache_size)
+        if data is None:
+            self._check_clinic_count(n_clinics)
+        if data is not None:
+            self.data = self._adopt_data(data)
+        elif cache_dir is not None:
+            self.data = cached_table(cache_dir, self._cache_params(), self._generate_data)
+        else:
+            self.data = self._generate_data()
+        self._build_index(cube)
     
-    def _generate_data(self) -> pd.DataFrame:
-        """Generate realistic clinic data"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=30 * self.months_back)
-        date_range = pd.date_range(start=start_date, end=end_date, freq='D')
-        records = []
-        
-        for date in date_range:
-            if date.weekday() == 6:
-                continue
-            
-            base_lambda = 60
-            weekday_coef = {0: 1.2, 3: 0.6, 5: 0.6}.get(date.weekday(), 1.0)
-            rain_coef = 0.8 if np.random.random() < 0.05 else 1.0
-            
-            adjusted_lambda = base_lambda * weekday_coef * rain_coef
-            daily_patients = int(np.random.poisson(adjusted_lambda))
-            daily_patients = max(15, min(95, daily_patients))
+    def _cache_params(self) -> dict:
+        """Everything that determines the synthetic table, for the disk cache key"""
+        cls = type(self)
+        return {
+            'source': 'synthetic',
+            'class': cls.__qualname__,
+            'model': {k: getattr(cls, k) for k in dir(cls) if k.isupper()},
+            'months_back': self.months_back,
+            'seed': self.seed,
+            'end_date': self.end_date.isoformat(),
+            'n_clinics': self.n_clinics,
+            'wait_model': wait_model_key(self.wait_model)
+        }
+    
+    @classmethod
+    def from_export(cls, path, chunksize: int = 200_000, column_map: dict = None,
+                    segment_codes: dict = None, visit_type_codes: dict = None,
+                    cache_dir=None, **kwargs):
+        """Build a DataManager from a CSV/Parquet visit export
+        
+        With cache_dir, the parsed table is kept on disk keyed by the file's
+        fingerprint and loader arguments; ``ingest_report`` is None on a hit.
+        """
+        report = None
+        
+        def build():
+            nonlocal report
+            data, report = load_visit_export(path, chunksize, column_map, segment_codes, visit_type_codes)
+            return data
+        
+        if cache_dir is None:
+            data = build()
+        else:
+            params = {
+                'source': export_fingerprint(path),
+                'column_map': column_map,
+                'segment_codes': segment_codes,
+                'visit_type_codes': visit_type_codes
+            }
+            data = cached_table(cache_dir, params, build)
+        dm = cls(data=data, **kwargs)
+        dm.ingest_report = report
+        return dm
+    
+    @classmethod
+    def from_shared(cls, root=SHARED_DATASET_DIR, generation: str = None, **kwargs):
+        """Map a generation published by publish_generation (default: CURRENT)
+        
+        Table and cube columns stay read-only memory maps, so each worker adds
+        little resident memory beyond its memoized results.
+        """
+        root = Path(root)
+        generation = generation or current_generation(root)
+        if generation is None:
+            raise FileNotFoundError(f"No dataset generation published under {root}")
+        data = load_table(root / generation / 'visits')
+        cube = RollupCube.load(root / generation / 'cube')
+        if data is None or cube is None:
+            raise FileNotFoundError(f"Dataset generation {generation} under {root} is missing or stale")
+        dm = cls(data=data, cube=cube, **kwargs)
+        dm.generation = generation
+        return dm
+    
+    def _adopt_data(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Take an externally loaded visit table, filling wait_time if absent"""
+        data = self._prepare_visits(data)
+        if 'wait_time' not in data.columns:
+            data['wait_time'] = self.wait_model(data).astype(VISIT_SCHEMA['wait_time'])
+        self.end_date = data['date'].max().to_pydatetime()
+        self.n_clinics = int(data['clinic_id'].nunique())
+        return data
+    
+    @staticmethod
+    def _prepare_visits(data: pd.DataFrame) -> pd.DataFrame:
+        """Fill derivable columns and cast a visit frame to VISIT_SCHEMA order and dtypes"""
+        missing = [c for c in EXPORT_REQUIRED if c not in data.columns]
+        if missing:
+            raise ValueError(f"Visits are missing required columns: {missing}")
+        if 'clinic_id' not in data.columns:
+            data = data.assign(clinic_id=0)
+        if 'weekday' not in data.columns:
+            data = data.assign(weekday=pd.to_datetime(data['date']).dt.weekday)
+        if 'patient_id' not in data.columns:
+            data = data.assign(patient_id=PATIENT_UNKNOWN)
+        for col in ('segment', 'visit_type'):
+            # An unknown label would cast to a NaN category (code -1) and index the cube wrongly
+            categories = VISIT_SCHEMA[col].categories
+            values = data[col]
+            unknown = (values.cat.codes.to_numpy() < 0 if values.dtype == VISIT_SCHEMA[col]
+                       else ~values.isin(categories).to_numpy())
+            if unknown.any():
+                examples = values[unknown].astype(str).unique()[:3].tolist()
+                raise ValueError(f"{int(unknown.sum())} visits have an unknown {col} (e.g. {examples}); "
+                                 f"expected one of {list(categories)}")
+        data = apply_visit_schema(data)[[c for c in VISIT_SCHEMA if c in data.columns]]
+        dates = data['date'].to_numpy()
+        if (dates != dates.astype('datetime64[D]')).any():  # leaves an already day-grained (mapped) column as is
+            data['date'] = data['date'].dt.normalize()  # day-grained, as stored; the hour has its own column
+        if not data['date'].is_monotonic_increasing:
+            data = data.sort_values('date', kind='stable')
+        return data.reset_index(drop=True)
+    
+    def _build_index(self, cube: RollupCube = None):
+        """Sort by date for binary-search slicing and build (or adopt) the rollup cube"""
+        if not self.data['date'].is_monotonic_increasing:
+            self.data = self.data.sort_values('date', kind='stable').reset_index(drop=True)
+        self._dates = self.data['date'].to_numpy()
+        self.cube = cube if cube is not None else RollupCube(self.data)
+    
+    def _rows_between(self, start, end) -> pd.DataFrame:
+        """Rows with start <= date < end, as a positional slice"""
+        lo = self._dates.searchsorted(np.datetime64(pd.Timestamp(start)), side='left')
+        hi = self._dates.searchsorted(np.datetime64(pd.Timestamp(end)), side='left')
+        return self.data.iloc[lo:hi]
+    
+    def row_count(self) -> int:
+        return len(self.data)
+    
+    def available_months(self) -> list:
+        """Months covered by the data, oldest first"""
+        if not len(self._dates):
+            return []
+        return list(pd.period_range(pd.Timestamp(self._dates[0]), pd.Timestamp(self._dates[-1]), freq='M'))
+    
+    def _range_cells(self, target, clinic_id=None, months: int = 1) -> pd.DataFrame:
+        """Cube cells for a Period or DateRange target (binary-searched slice)"""
+        span = DateRange.of(target, months)
+        cells = self.cube.select(span.start, span.end, clinic_id)
+        active_profiler().touch(len(cells))
+        return cells
+    
+    def _range_rows(self, target, clinic_id=None) -> pd.DataFrame:
+        span = DateRange.of(target)
+        rows = self._rows_between(span.start, span.end)
+        active_profiler().touch(len(rows))
+        return self._filter_clinic(rows, clinic_id)
+    
+    @staticmethod
+    def _filter_clinic(rows: pd.DataFrame, clinic_id) -> pd.DataFrame:
+        """Restrict rows to one clinic id or a collection of ids (None = all)"""
+        if clinic_id is None:
+            return rows
+        if np.isscalar(clinic_id):
+            return rows[rows['clinic_id'].to_numpy() == clinic_id]
+        return rows[np.isin(rows['clinic_id'].to_numpy(), list(clinic_id))]
+    
+    def invalidate(self, target_month=None):
+        """Drop memoized aggregates (all, or those touching a month / DateRange)
+        
+        Entries without a date argument (cohorts) span the whole history and
+        are always dropped.
+        """
+        if target_month is None:
+            self.cache.invalidate()
+        else:
+            changed = DateRange.of(target_month)
             
-            for _ in range(daily_patients):
-                segment_prob = [0.4, 0.5, 0.1]
-                if date.month in [12, 1, 2]:
-                    segment_prob = [0.35, 0.6, 0.05]
-                
-                segment = np.random.choice(['lifestyle', 'acute', 'checkup'], p=segment_prob)
-                
-                if segment == 'lifestyle':
-                    revenue = int(np.random.normal(5000, 1200))
-                    revenue = max(3000, min(9000, revenue))
-                    visit_type = '再診' if np.random.random() < 0.85 else '初診'
-                elif segment == 'acute':
-                    revenue = int(np.random.normal(2800, 600))
-                    revenue = max(1800, min(5000, revenue))
-                    visit_type = '初診' if np.random.random() < 0.35 else '再診'
-                else:
-                    if date.weekday() != 5:
-                        continue
-                    revenue = int(np.random.normal(16000, 2500))
-                    revenue = max(12000, min(22000, revenue))
-                    visit_type = '検診'
-                
-                age_params = {
-                    'lifestyle': (58, 12),
-                    'acute': (40, 18),
-                    'checkup': (47, 10)
-                }
-                age = int(np.random.normal(*age_params[segment]))
-                age = max(22, min(82, age))
-                
-                hour = np.random.choice(
-                    [9, 10, 11, 12, 14, 15, 16, 17],
-                    p=[0.08, 0.16, 0.24, 0.09, 0.11, 0.21, 0.08, 0.03]
-                )
-                
-                records.append({
-                    'date': date,
-                    'segment': segment,
-                    'visit_type': visit_type,
-                    'age': age,
-                    'revenue': revenue,
-                    'hour': hour,
-                    'weekday': date.weekday()
-                })
-        
-        df = pd.DataFrame(records)
-        df['date'] = pd.to_datetime(df['date'])
-        
-        daily_counts = df.groupby('date').size()
-        df['wait_time'] = df['date'].map(
-            lambda d: int(((daily_counts.get(d, 0) / 60) ** 2) * 35)
-        )
-        df['wait_time'] = df['wait_time'].clip(8, 135)
+            def touches(key):
+                name, args, kwargs = key
+                options = dict(kwargs)
+                spans = []
+                for v in list(args) + list(options.values()):
+                    if isinstance(v, (pd.Period, DateRange)):
+                        span = DateRange.of(v, options.get('months', 1) if isinstance(v, pd.Period) else 1)
+                        spans.append(span)
+                        if name == 'get_kpi_summary' and 'compare' not in options:
+                            spans.append(self._default_comparison(v))
+                return not spans or any(span.overlaps(changed) for span in spans)
+            self.cache.invalidate(touches)
+    
+    def _generate_data(self) -> pd.DataFrame:
+        """Generate realistic clinic data, sharded by clinic × month"""
+        start_date = self.end_date - timedelta(days=30 * self.months_back)
+        date_range = pd.date_range(start=start_date, end=self.end_date, freq='D')
+        days = date_range[date_range.weekday != 6]
+        months = days.to_period('M')
+        month_days = [days[months == m] for m in months.unique()]
+        
+        # One SeedSequence child per shard: identical output for any worker count
+        shards = [(clinic, d) for clinic in range(self.n_clinics) for d in month_days]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(shards))
+        specs = [(clinic, d, ss) for (clinic, d), ss in zip(shards, seeds)]
+        
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                parts = list(pool.map(type(self)._generate_shard, specs,
+                                      chunksize=max(1, len(specs) // (self.workers * 4))))
+        else:
+            parts = [self._generate_shard(spec) for spec in specs]
+        
+        df = frame_from_parts(parts)
+        if self.n_clinics > 1:
+            df = df.take(np.argsort(df['date'].to_numpy(), kind='stable')).reset_index(drop=True)
+        
+        df['wait_time'] = self.wait_model(df)
+        # One more SeedSequence child, after the shards', for patient identities
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed).spawn(len(shards) + 1)[-1])
+        df = apply_visit_schema(df)
+        df['patient_id'] = self._assign_patients(df, rng)
         
         return df
     
-    def get_kpi_summary(self, target_month: pd.Period) -> dict:
-        """Calculate KPIs"""
-        df_curr = self.data[self.data['date'].dt.to_period('M') == target_month]
-        df_prev = self.data[self.data['date'].dt.to_period('M') == (target_month - 1)]
+    @classmethod
+    def _generate_shard(cls, spec) -> dict:
+        """Generate one clinic-month as compact column arrays (vectorized)"""
+        clinic_id, days, seed_seq = spec
+        rng = np.random.default_rng(seed_seq)
+        day_weekday = days.weekday.to_numpy().astype(np.int8)
+        
+        # Daily volume: Poisson around the weekday/rain-adjusted lambda
+        weekday_coef = np.array([cls.WEEKDAY_COEF.get(w, 1.0) for w in range(7)])
+        rain_coef = np.where(rng.random(len(days)) < cls.RAIN_PROB, cls.RAIN_COEF, 1.0)
+        lam = cls.BASE_LAMBDA * weekday_coef[day_weekday] * rain_coef
+        daily_patients = rng.poisson(lam).clip(cls.DAILY_MIN, cls.DAILY_MAX)
+        day_idx = np.repeat(np.arange(len(days)), daily_patients)
+        
+        # Segment mix (winter shifts toward acute)
+        winter = np.isin(days.month.to_numpy(), cls.WINTER_MONTHS)[day_idx]
+        u = rng.random(len(day_idx))
+        last = len(cls.SEGMENTS) - 1
+        seg_code = np.where(
+            winter,
+            np.searchsorted(np.cumsum(cls.SEGMENT_PROB_WINTER), u, side='right'),
+            np.searchsorted(np.cumsum(cls.SEGMENT_PROB), u, side='right')
+        ).clip(0, last)
+        
+        # Checkups are only booked on Saturdays
+        lifestyle, acute, checkup = (cls.SEGMENTS.index(s) for s in ('lifestyle', 'acute', 'checkup'))
+        keep = (seg_code != checkup) | (day_weekday[day_idx] == 5)
+        day_idx, seg_code = day_idx[keep], seg_code[keep]
+        n = len(day_idx)
+        
+        rev = np.array([cls.REVENUE_PARAMS[s] for s in cls.SEGMENTS], dtype=float)
+        revenue = rng.normal(rev[seg_code, 0], rev[seg_code, 1]).astype(np.int64)
+        revenue = np.clip(revenue, rev[seg_code, 2], rev[seg_code, 3])
+        
+        # visit_type codes follow VISIT_SCHEMA: 初診=0, 再診=1, 検診=2
+        u = rng.random(n)
+        visit_type = np.select(
+            [seg_code == lifestyle, seg_code == acute],
+            [np.where(u < 0.85, 1, 0), np.where(u < 0.35, 0, 1)],
+            default=2
+        )
+        
+        age_params = np.array([cls.AGE_PARAMS[s] for s in cls.SEGMENTS], dtype=float)
+        age = rng.normal(age_params[seg_code, 0], age_params[seg_code, 1]).astype(np.int64)
+        age = age.clip(cls.AGE_MIN, cls.AGE_MAX)
+        
+        hour = rng.choice(cls.HOURS, size=n, p=cls.HOUR_PROB)
+        
+        return {
+            'date': days.to_numpy()[day_idx],
+            'clinic_id': np.full(n, clinic_id, dtype=np.int16),
+            'segment': seg_code.astype(np.int8),
+            'visit_type': visit_type.astype(np.int8),
+            'age': age.astype(np.int8),
+            'revenue': revenue.astype(np.int32),
+            'hour': hour.astype(np.int8),
+            'weekday': day_weekday[day_idx]
+        }
+    
+    @classmethod
+    def _check_clinic_count(cls, n_clinics: int):
+        if n_clinics > cls.MAX_CLINICS:
+            raise ValueError(f"Synthetic patient ids support at most {cls.MAX_CLINICS} clinics, "
+                             f"got {n_clinics}")
+    
+    @classmethod
+    def _assign_patients(cls, visits: pd.DataFrame, rng: np.random.Generator,
+                         first_visits: pd.DataFrame = None, next_id: int = 0) -> np.ndarray:
+        """Synthetic patient ids for date-sorted visits (vectorized)
+        
+        Every 初診 is a new patient, numbered from ``next_id``. Any other visit
+        draws a first-visit time ~RETURN_DAYS before it and returns to the
+        latest new patient of the same clinic and segment at or before then,
+        from ``first_visits`` (earlier 初診 rows with ids) or ``visits``; times
+        before the first such patient map to a legacy patient bucket.
+        """
+        n_seg = len(cls.SEGMENTS)
+        if len(visits):
+            cls._check_clinic_count(int(visits['clinic_id'].max()) + 1)
+        
+        def group_and_day(frame):
+            group = (frame['clinic_id'].to_numpy().astype(np.int64) * n_seg
+                     + frame['segment'].cat.codes.to_numpy())
+            return group, frame['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        
+        group, day = group_and_day(visits)
+        segment = visits['segment'].cat.codes.to_numpy()
+        new = visits['visit_type'].cat.codes.to_numpy() == 0
+        ids = np.empty(len(visits), dtype=np.int64)
+        ids[new] = next_id + np.arange(int(new.sum()))
+        
+        cand_group, cand_day, cand_id = group[new], day[new], ids[new]
+        if first_visits is not None and len(first_visits):
+            prior_group, prior_day = group_and_day(first_visits)
+            cand_group = np.concatenate([prior_group, cand_group])
+            cand_day = np.concatenate([prior_day, cand_day])
+            cand_id = np.concatenate([first_visits['patient_id'].to_numpy(), cand_id])
+        
+        # Candidates keyed by (group, first-visit time); jitter spreads one day's patients
+        day_span = 2**20
+        cand_key = cand_group * day_span + cand_day + rng.random(len(cand_day))
+        order = np.argsort(cand_key)
+        cand_key, cand_group, cand_id = cand_key[order], cand_group[order], cand_id[order]
+        
+        back = np.flatnonzero(~new)
+        mean_days = np.array([cls.RETURN_DAYS[s] for s in cls.SEGMENTS], dtype=float)
+        when = day[back] - rng.exponential(mean_days[segment[back]])
+        pos = np.searchsorted(cand_key, group[back] * day_span + when, side='right') - 1
+        found = pos >= 0
+        found[found] = cand_group[pos[found]] == group[back][found]
+        ids[back[found]] = cand_id[pos[found]]
+        
+        legacy = ~found
+        rate = np.array([cls.NEW_PATIENTS_PER_DAY[s] for s in cls.SEGMENTS])[segment[back][legacy]]
+        bucket = np.floor(when[legacy] * rate).astype(np.int64) % cls.LEGACY_PATIENT_SPAN
+        ids[back[legacy]] = (cls.LEGACY_PATIENT_BASE
+                             + group[back][legacy] * cls.LEGACY_PATIENT_SPAN + bucket)
+        return ids.astype(VISIT_SCHEMA['patient_id'])
+    
+    def _patient_history(self):
+        """(初診 rows with patient ids, next free patient id) for extending the table"""
+        first = self.data[self.data['visit_type'].cat.codes.to_numpy() == 0]
+        first = first[first['patient_id'].to_numpy() != PATIENT_UNKNOWN]
+        next_id = int(first['patient_id'].max()) + 1 if len(first) else 0
+        return first[['date', 'clinic_id', 'segment', 'patient_id']], next_id
+    
+    def _merge_tail(self, existing: pd.DataFrame, visits: pd.DataFrame) -> pd.DataFrame:
+        """Existing rows from the first new visit's day onward, plus visits, in date order
+        
+        New visits without ``wait_time`` get it from the wait model, which sees
+        the load of the whole tail; existing rows keep their stored values.
+        """
+        tail = pd.concat([existing, visits], ignore_index=True)
+        if 'wait_time' not in visits.columns:
+            is_new = np.arange(len(tail)) >= len(existing)
+            wait = self.wait_model(tail).astype(VISIT_SCHEMA['wait_time'])
+            tail['wait_time'] = np.where(is_new, wait, tail['wait_time'].fillna(0).to_numpy()
+                                         ).astype(VISIT_SCHEMA['wait_time'])
+        return tail.sort_values('date', kind='stable').reset_index(drop=True)
+    
+    def append_visits(self, visits: pd.DataFrame):
+        """Add new visits (typically one day's)
+        
+        Wait times, cube cells and memoized aggregates are re-processed only
+        from the earliest new visit's day onward (see _merge_tail). The table
+        and cube themselves are still re-concatenated, one O(history) copy per
+        call, so batch large loads into one call or rebuild instead.
+        """
+        visits = self._prepare_visits(visits)
+        if visits.empty:
+            return
+        start = visits['date'].iloc[0].normalize()  # the whole first day
+        split = self._dates.searchsorted(np.datetime64(start), side='left')
+        
+        tail = self._merge_tail(self.data.iloc[split:], visits)
+        self.data = pd.concat([self.data.iloc[:split], tail], ignore_index=True)
+        self._dates = self.data['date'].to_numpy()
+        self.cube.replace_from(tail)
+        self.end_date = max(self.end_date, tail['date'].iloc[-1].to_pydatetime())
+        self.n_clinics = max(self.n_clinics, int(tail['clinic_id'].max()) + 1)
+        
+        for month in tail['date'].dt.to_period('M').unique():
+            self.invalidate(month)
+    
+    def append_day(self, day: date):
+        """Synthesize one more day of visits for every clinic and append it"""
+        days = pd.DatetimeIndex([pd.Timestamp(day)])
+        if days.weekday[0] == 6:
+            return
+        *seeds, patient_seed = np.random.SeedSequence([self.seed, days[0].toordinal()]).spawn(self.n_clinics + 1)
+        parts = [self._generate_shard((clinic, days, ss)) for clinic, ss in enumerate(seeds)]
+        visits = apply_visit_schema(frame_from_parts(parts))
+        visits['patient_id'] = self._assign_patients(visits, np.random.default_rng(patient_seed),
+                                                     *self._patient_history())
+        self.append_visits(visits)
+    
+    def set_wait_model(self, wait_model):
+        """Swap the wait-time model and recompute the column in place"""
+        self.wait_model = wait_model
+        self.data['wait_time'] = wait_model(self.data).astype(VISIT_SCHEMA['wait_time'])
+        self.cube = RollupCube(self.data)
+        self.invalidate()
+    
+    @staticmethod
+    def _default_comparison(target) -> DateRange:
+        if isinstance(target, pd.Period):
+            return DateRange.of(target - 1)
+        return target.previous()
+    
+    def _totals(self, target, clinic_id=None) -> dict:
+        """visits / revenue / wait_sum / first-visit totals for a target"""
+        return self.cube.totals(self._range_cells(target, clinic_id))
+    
+    @memoized_query
+    def get_kpi_summary(self, target_month, clinic_id=None, *, compare=None) -> dict:
+        """Calculate KPIs (from the rollup cube)
+        
+        target_month is a Period or a DateRange; deltas are against compare
+        (default: the previous period / equally long preceding span).
+        """
+        if compare is None:
+            compare = self._default_comparison(target_month)
+        curr = self._totals(target_month, clinic_id)
+        prev = self._totals(compare, clinic_id)
         
         def calc_delta(curr, prev):
             return ((curr - prev) / prev * 100) if prev > 0 else 0
         
+        def mean_wait(t):
+            return t['wait_sum'] / t['visits'] if t['visits'] else np.nan
+        
+        def first_rate(t):
+            return t['first'] / t['visits'] * 100 if t['visits'] else 0
+        
         return {
             'revenue': {
-                'value': df_curr['revenue'].sum(),
-                'delta': calc_delta(df_curr['revenue'].sum(), df_prev['revenue'].sum())
+                'value': curr['revenue'],
+                'delta': calc_delta(curr['revenue'], prev['revenue'])
             },
             'visits': {
-                'value': len(df_curr),
-                'delta': calc_delta(len(df_curr), len(df_prev))
+                'value': curr['visits'],
+                'delta': calc_delta(curr['visits'], prev['visits'])
             },
             'wait_time': {
-                'value': df_curr['wait_time'].mean(),
-                'delta': calc_delta(df_curr['wait_time'].mean(), df_prev['wait_time'].mean())
+                'value': mean_wait(curr),
+                'delta': calc_delta(mean_wait(curr), mean_wait(prev))
             },
             'first_rate': {
-                'value': (df_curr['visit_type'] == '初診').sum() / len(df_curr) * 100 if len(df_curr) > 0 else 0,
-                'delta': (df_curr['visit_type'] == '初診').sum() / len(df_curr) * 100 - 
-                        (df_prev['visit_type'] == '初診').sum() / len(df_prev) * 100 if len(df_prev) > 0 else 0
+                'value': first_rate(curr),
+                'delta': first_rate(curr) - first_rate(prev) if prev['visits'] > 0 else 0
             }
         }
     
-    def get_daily_trend(self, target_month: pd.Period) -> pd.DataFrame:
-        """Daily aggregation"""
-        df_month = self.data[self.data['date'].dt.to_period('M') == target_month]
-        return df_month.groupby('date').agg({
-            'revenue': 'sum',
-            'date': 'count'
-        }).rename(columns={'date': 'visits'}).reset_index()
-    
-    def get_heatmap_data(self, target_month: pd.Period) -> pd.DataFrame:
-        """Heatmap data"""
-        df_month = self.data[self.data['date'].dt.to_period('M') == target_month]
-        heatmap = df_month.groupby(['weekday', 'hour']).size().reset_index(name='count')
-        return heatmap.pivot(index='hour', columns='weekday', values='count').fillna(0)
-    
-    def get_segment_distribution(self, target_month: pd.Period) -> pd.DataFrame:
+    @memoized_query
+    def get_daily_trend(self, target_month, clinic_id=None, *, months: int = 1) -> pd.DataFrame:
+        """Daily aggregation (``months`` > 1: that many months ending at target_month)"""
+        cells = self._range_cells(target_month, clinic_id, months=months)
+        return cells.groupby('date')[['revenue', 'visits']].sum().reset_index()
+    
+    @memoized_query
+    def get_heatmap_data(self, target_month, clinic_id=None, *,
+                         metric: str = 'visits') -> pd.DataFrame:
+        """Heatmap data on a fixed HOURS × Mon–Sat grid
+        
+        metric: 'visits' (count), 'revenue' (sum) or 'wait_time' (mean; NaN
+        where a slot had no visits). Hours outside HOURS are not shown.
+        """
+        if metric not in HEATMAP_METRICS:
+            raise ValueError(f"Unknown heatmap metric {metric!r}; expected one of {list(HEATMAP_METRICS)}")
+        return self._heatmap_frame(self._range_cells(target_month, clinic_id), metric)
+    
+    def _heatmap_frame(self, cells: pd.DataFrame, metric: str) -> pd.DataFrame:
+        """HOURS × Mon–Sat grid from rows of hour, weekday, visits, revenue, wait_sum"""
+        n_rows, n_cols = len(self.HOURS), len(WEEKDAY_LABELS)
+        row_of_hour = np.full(24, -1)
+        row_of_hour[self.HOURS] = np.arange(n_rows)
+        row = row_of_hour[cells['hour'].to_numpy()]
+        col = cells['weekday'].to_numpy().astype(np.int64)
+        inside = (row >= 0) & (col < n_cols)
+        slot = row[inside] * n_cols + col[inside]
+        
+        def grid(column):
+            weights = cells[column].to_numpy()[inside]
+            return np.bincount(slot, weights=weights, minlength=n_rows * n_cols).reshape(n_rows, n_cols)
+        
+        visits = grid('visits').astype(np.int64)
+        if metric == 'visits':
+            values = visits
+        elif metric == 'revenue':
+            values = grid('revenue').astype(np.int64)
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                values = np.where(visits > 0, grid('wait_sum') / visits, np.nan)
+        return pd.DataFrame(values, index=pd.Index(self.HOURS, name='hour'),
+                            columns=pd.Index(range(n_cols), name='weekday'))
+    
+    @memoized_query
+    def get_segment_distribution(self, target_month, clinic_id=None) -> pd.DataFrame:
         """Segment breakdown"""
-        df_month = self.data[self.data['date'].dt.to_period('M') == target_month]
-        segment_map = {'lifestyle': '生活習慣病', 'acute': '急性疾患', 'checkup': '検診・ドック'}
-        dist = df_month['segment'].value_counts().reset_index()
+        cells = self._range_cells(target_month, clinic_id)
+        return self._segment_frame(cells.groupby('segment', observed=True)['visits'].sum())
+    
+    @staticmethod
+    def _segment_frame(counts: pd.Series) -> pd.DataFrame:
+        """Visit counts per segment (category-indexed) -> labelled, largest first"""
+        counts = counts.sort_values(ascending=False, kind='stable')
+        dist = counts[counts > 0].reset_index()
         dist.columns = ['segment', 'count']
-        dist['segment'] = dist['segment'].map(segment_map)
+        dist['segment'] = dist['segment'].astype(str).map(SEGMENT_LABELS)
         return dist
     
-    def get_age_distribution(self, target_month: pd.Period) -> pd.DataFrame:
-        """Age distribution"""
-        df_month = self.data[self.data['date'].dt.to_period('M') == target_month]
+    @memoized_query
+    def get_age_distribution(self, target_month, clinic_id=None) -> pd.DataFrame:
+        """Raw ages (drill-down; charts use get_age_histogram)"""
+        df_month = self._range_rows(target_month, clinic_id)
         return df_month[['age']]
+    
+    @memoized_query
+    def get_age_histogram(self, target_month, clinic_id=None, *,
+                          by_segment: bool = False) -> pd.DataFrame:
+        """Visit counts per AGE_BIN_EDGES bin, optionally per segment
+        
+        Columns: [segment,] age_from, age_to (exclusive), count. Every bin is
+        present, so the frame has a fixed shape.
+        """
+        span = DateRange.of(target_month)
+        age_cells, hist = self.cube.select_ages(span.start, span.end, clinic_id)
+        active_profiler().touch(len(age_cells))
+        if not by_segment:
+            return self._age_histogram_frame(hist.sum(axis=0, dtype=np.int64))
+        
+        counts = np.zeros((len(VISIT_SCHEMA['segment'].categories), len(AGE_BIN_EDGES) - 1), dtype=np.int64)
+        np.add.at(counts, age_cells['segment'].cat.codes.to_numpy(), hist)
+        return self._age_histogram_frame(counts)
+    
+    @staticmethod
+    def _age_histogram_frame(counts: np.ndarray) -> pd.DataFrame:
+        """Frame for per-bin counts: shape (bins,) or (segments, bins) for by_segment"""
+        lower, upper = AGE_BIN_EDGES[:-1], AGE_BIN_EDGES[1:]
+        if counts.ndim == 1:
+            return pd.DataFrame({'age_from': lower, 'age_to': upper, 'count': counts})
+        
+        segments = VISIT_SCHEMA['segment'].categories
+        return pd.DataFrame({
+            'segment': np.repeat([SEGMENT_LABELS[s] for s in segments], len(lower)),
+            'age_from': np.tile(lower, len(segments)),
+            'age_to': np.tile(upper, len(segments)),
+            'count': counts.ravel()
+        })
+    
+    @memoized_query
+    def _cohorts(self, clinic_id=None) -> CohortEngine:
+        """Cohort engine over the whole history"""
+        rows = self._filter_clinic(self.data, clinic_id)
+        active_profiler().touch(len(rows))
+        return CohortEngine(rows['patient_id'].to_numpy(), rows['date'].to_numpy(),
+                            rows['visit_type'].cat.codes.to_numpy(), rows['segment'].cat.codes.to_numpy())
+    
+    @memoized_query
+    def get_retention_matrix(self, clinic_id=None, *, months: int = 12, rate: bool = True) -> pd.DataFrame:
+        """Monthly retention of first-visit (初診) cohorts (see CohortEngine.retention)"""
+        return self._cohorts(clinic_id).retention(months, rate)
+    
+    @memoized_query
+    def get_revisit_intervals(self, target_month, clinic_id=None) -> pd.DataFrame:
+        """Days since the same patient's previous visit, for revisits in the target
+        
+        Columns: segment, interval (REVISIT_BIN_LABELS), days_from, count;
+        every segment × bin is present.
+        """
+        span = DateRange.of(target_month)
+        counts = self._cohorts(clinic_id).interval_counts(span.start, span.end)
+        segments = VISIT_SCHEMA['segment'].categories
+        return pd.DataFrame({
+            'segment': np.repeat([SEGMENT_LABELS[s] for s in segments], len(REVISIT_BIN_EDGES)),
+            'interval': np.tile(REVISIT_BIN_LABELS, len(segments)),
+            'days_from': np.tile(REVISIT_BIN_EDGES, len(segments)),
+            'count': counts.ravel()
+        })
+    
+    @memoized_query
+    def get_clinic_breakdown(self, target_month, clinic_id=None) -> pd.DataFrame:
+        """Per-clinic KPIs"""
+        df_month = self._range_rows(target_month, clinic_id)
+        return df_month.groupby('clinic_id').agg(
+            visits=('revenue', 'size'),
+            revenue=('revenue', 'sum'),
+            wait_time=('wait_time', 'mean'),
+            first_rate=('visit_type', lambda v: (v == '初診').mean() * 100)
+        ).reset_index()
+
+# ------------------------------------------------------------
+# SQLite backend: aggregates pushed down into the database
+# ------------------------------------------------------------
+
+VISIT_DB_SCHEMA = """
+CREATE TABLE visits (
+    date INTEGER NOT NULL,        -- days since 1970-01-01
+    clinic_id INTEGER NOT NULL,
+    segment INTEGER NOT NULL,     -- VISIT_SCHEMA category codes
+    visit_type INTEGER NOT NULL,
+    age INTEGER NOT NULL,
+    revenue INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    weekday INTEGER NOT NULL,
+    wait_time INTEGER NOT NULL,
+    patient_id INTEGER NOT NULL   -- PATIENT_UNKNOWN when the source has none
+)
+"""
+VISIT_DB_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS visits_date ON visits (date, clinic_id)",
+    "CREATE INDEX IF NOT EXISTS visits_slot ON visits (weekday, hour)"
+]
+VISIT_DB_COLUMNS = list(VISIT_SCHEMA)
+# One streamed row of SQLiteDataManager._cohorts (date as epoch days, categoricals as codes)
+COHORT_ROW = np.dtype([('patient_id', VISIT_SCHEMA['patient_id']), ('date', np.int32),
+                       ('visit_type', np.int8), ('segment', np.int8)])
+
+def _epoch_day(ts) -> int:
+    """First whole day at or after ts, as days since the epoch"""
+    return int(np.ceil((pd.Timestamp(ts) - pd.Timestamp(0)) / pd.Timedelta(days=1)))
+
+def _insert_visits(conn: sqlite3.Connection, visits: pd.DataFrame, chunksize: int = 100_000):
+    for lo in range(0, len(visits), chunksize):
+        chunk = visits.iloc[lo:lo + chunksize]
+        columns = [chunk['date'].to_numpy().astype('datetime64[D]').astype(np.int64)]
+        for col in VISIT_DB_COLUMNS[1:]:
+            values = chunk[col]
+            columns.append(values.cat.codes.to_numpy() if isinstance(values.dtype, pd.CategoricalDtype)
+                           else values.to_numpy())
+        conn.executemany(f"INSERT INTO visits VALUES ({', '.join('?' * len(columns))})",
+                         zip(*(c.tolist() for c in columns)))
+
+def write_visit_db(data: pd.DataFrame, path):
+    """Write a schema-conformant visit table to a new SQLite file, atomically"""
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    tmp.unlink(missing_ok=True)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(VISIT_DB_SCHEMA)
+        _insert_visits(conn, data)
+        for statement in VISIT_DB_INDEXES:  # after the bulk load: one sort instead of per-row updates
+            conn.execute(statement)
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+
+class SQLiteDataManager(DataManager):
+    """DataManager backed by an SQLite file instead of an in-memory table
+    
+    Every getter is a GROUP BY over the (date, clinic_id)-indexed visits
+    table that returns only the rows the result needs, then shares the
+    in-memory backend's post-processing, so results are identical while
+    memory is bounded by result size rather than history length.
+    """
+    
+    def __init__(self, db_path, cache_size: int = 64, wait_model=None, seed: int = 42):
+        self.db_path = Path(db_path)
+        if not self.db_path.exists():
+            raise FileNotFoundError(f"No visit database at {self.db_path}")
+        self.seed = seed
+        self.workers = 1
+        self.wait_model = wait_model or DailyLoadWaitModel()
+        self.cache = LRUCache(maxsize=cache_size)
+        self._local = threading.local()
+        columns = [row[1] for row in self._query("PRAGMA table_info(visits)")]
+        missing = [col for col in VISIT_DB_COLUMNS if col not in columns]
+        if missing:
+            raise ValueError(f"{self.db_path} has no visits table or predates columns {missing}; "
+                             f"rebuild it with SQLiteDataManager.build")
+        first, last, max_clinic = self._query("SELECT MIN(date), MAX(date), MAX(clinic_id) FROM visits")[0]
+        self.end_date = pd.Timestamp(last or 0, unit='D').to_pydatetime()
+        self.n_clinics = (max_clinic or 0) + 1
+    
+    @classmethod
+    def build(cls, db_path, source, wait_model=None, **kwargs):
+        """Write a DataManager's table (or a visit frame, e.g. an export) to db_path and open it
+        
+        From a DataManager, ``seed`` and ``wait_model`` default to its own, so
+        append_day on the database continues the same synthetic stream.
+        """
+        if isinstance(source, DataManager):
+            kwargs.setdefault('seed', source.seed)
+            wait_model = wait_model or source.wait_model
+            source = source.data
+        data = cls._prepare_visits(source)
+        if 'wait_time' not in data.columns:
+            data['wait_time'] = (wait_model or DailyLoadWaitModel())(data).astype(VISIT_SCHEMA['wait_time'])
+        write_visit_db(data, db_path)
+        return cls(db_path, wait_model=wait_model, **kwargs)
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Read-only connection, one per thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True)
+        return conn
+    
+    @contextmanager
+    def _writer(self):
+        """Read-write connection for one transaction; committed (or rolled back) and closed"""
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            yield conn
+    
+    def _query(self, sql: str, params=()) -> list:
+        rows = self._connection().execute(sql, params).fetchall()
+        active_profiler().touch(len(rows))
+        return rows
+    
+    def _frame(self, sql: str, params, columns: list) -> pd.DataFrame:
+        return pd.DataFrame(self._query(sql, params), columns=columns)
+    
+    @staticmethod
+    def _where(target, clinic_id=None, months: int = 1):
+        """WHERE clause and parameters for a Period/DateRange target and clinic filter"""
+        span = DateRange.of(target, months)
+        sql = "date >= ? AND date < ?"
+        params = [_epoch_day(span.start), _epoch_day(span.end)]
+        if clinic_id is not None:
+            ids = [clinic_id] if np.isscalar(clinic_id) else list(clinic_id)
+            sql += f" AND clinic_id IN ({', '.join('?' * len(ids))})"
+            params += [int(i) for i in ids]
+        return sql, params
+    
+    @staticmethod
+    def _categories(codes, column: str) -> pd.Categorical:
+        return pd.Categorical.from_codes(np.asarray(codes, dtype=np.int8), dtype=VISIT_SCHEMA[column])
+    
+    def row_count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM visits")[0][0]
+    
+    def available_months(self) -> list:
+        first, last = self._query("SELECT MIN(date), MAX(date) FROM visits")[0]
+        if first is None:
+            return []
+        return list(pd.period_range(pd.Timestamp(first, unit='D'), pd.Timestamp(last, unit='D'), freq='M'))
+    
+    def _totals(self, target, clinic_id=None) -> dict:
+        where, params = self._where(target, clinic_id)
+        rows = self._frame(
+            f"SELECT visit_type, COUNT(*), SUM(revenue), SUM(wait_time) FROM visits "
+            f"WHERE {where} GROUP BY visit_type", params, ['visit_type', 'visits', 'revenue', 'wait_sum'])
+        rows['visit_type'] = self._categories(rows['visit_type'], 'visit_type')
+        return RollupCube.totals(rows)
+    
+    @memoized_query
+    def get_daily_trend(self, target_month, clinic_id=None, *, months: int = 1) -> pd.DataFrame:
+        """Daily aggregation (``months`` > 1: that many months ending at target_month)"""
+        where, params = self._where(target_month, clinic_id, months)
+        daily = self._frame(
+            f"SELECT date, SUM(revenue), COUNT(*) FROM visits WHERE {where} GROUP BY date ORDER BY date",
+            params, ['date', 'revenue', 'visits'])
+        daily['date'] = daily['date'].to_numpy().astype('datetime64[D]').astype(VISIT_SCHEMA['date'])
+        return daily.astype({'revenue': np.int32, 'visits': np.int32})  # the cube's measure dtypes
+    
+    @memoized_query
+    def get_heatmap_data(self, target_month, clinic_id=None, *,
+                         metric: str = 'visits') -> pd.DataFrame:
+        """Heatmap data on a fixed HOURS × Mon–Sat grid (see DataManager)"""
+        if metric not in HEATMAP_METRICS:
+            raise ValueError(f"Unknown heatmap metric {metric!r}; expected one of {list(HEATMAP_METRICS)}")
+        where, params = self._where(target_month, clinic_id)
+        slots = self._frame(
+            f"SELECT hour, weekday, COUNT(*), SUM(revenue), SUM(wait_time) FROM visits "
+            f"WHERE {where} GROUP BY weekday, hour", params, ['hour', 'weekday', 'visits', 'revenue', 'wait_sum'])
+        return self._heatmap_frame(slots, metric)
+    
+    @memoized_query
+    def get_segment_distribution(self, target_month, clinic_id=None) -> pd.DataFrame:
+        """Segment breakdown"""
+        where, params = self._where(target_month, clinic_id)
+        rows = self._frame(f"SELECT segment, COUNT(*) FROM visits WHERE {where} GROUP BY segment ORDER BY segment",
+                           params, ['segment', 'visits'])
+        index = pd.CategoricalIndex(self._categories(rows['segment'], 'segment'), name='segment')
+        return self._segment_frame(pd.Series(rows['visits'].to_numpy(np.int32), index=index, name='visits'))
+    
+    @memoized_query
+    def get_age_distribution(self, target_month, clinic_id=None) -> pd.DataFrame:
+        """Raw ages (drill-down; charts use get_age_histogram)"""
+        where, params = self._where(target_month, clinic_id)
+        ages = self._frame(f"SELECT age FROM visits WHERE {where}", params, ['age'])
+        return ages.astype({'age': VISIT_SCHEMA['age']})
+    
+    @memoized_query
+    def get_age_histogram(self, target_month, clinic_id=None, *,
+                          by_segment: bool = False) -> pd.DataFrame:
+        """Visit counts per AGE_BIN_EDGES bin, optionally per segment"""
+        where, params = self._where(target_month, clinic_id)
+        # Group by exact age (a few dozen values) and bin here, so any edges work
+        rows = self._frame(f"SELECT segment, age, COUNT(*) FROM visits WHERE {where} GROUP BY segment, age",
+                           params, ['segment', 'age', 'count'])
+        n_bins = len(AGE_BIN_EDGES) - 1
+        bins = age_bin_index(rows['age'].to_numpy())
+        if not by_segment:
+            return self._age_histogram_frame(
+                np.bincount(bins, weights=rows['count'], minlength=n_bins).astype(np.int64))
+        n_seg = len(VISIT_SCHEMA['segment'].categories)
+        flat = rows['segment'].to_numpy() * n_bins + bins
+        counts = np.bincount(flat, weights=rows['count'], minlength=n_seg * n_bins).astype(np.int64)
+        return self._age_histogram_frame(counts.reshape(n_seg, n_bins))
+    
+    @memoized_query
+    def get_clinic_breakdown(self, target_month, clinic_id=None) -> pd.DataFrame:
+        """Per-clinic KPIs"""
+        where, params = self._where(target_month, clinic_id)
+        breakdown = self._frame(
+            f"SELECT clinic_id, COUNT(*), SUM(revenue), AVG(wait_time), AVG(visit_type = 0) * 100.0 "
+            f"FROM visits WHERE {where} GROUP BY clinic_id ORDER BY clinic_id",
+            params, ['clinic_id', 'visits', 'revenue', 'wait_time', 'first_rate'])
+        return breakdown.astype({'clinic_id': VISIT_SCHEMA['clinic_id'], 'revenue': VISIT_SCHEMA['revenue']})
+    
+    @memoized_query
+    def _cohorts(self, clinic_id=None) -> CohortEngine:
+        """Cohort engine over the whole history; reads only the four columns it needs"""
+        sql, params = "patient_id != ?", [PATIENT_UNKNOWN]
+        if clinic_id is not None:
+            ids = [clinic_id] if np.isscalar(clinic_id) else list(clinic_id)
+            sql += f" AND clinic_id IN ({', '.join('?' * len(ids))})"
+            params += [int(i) for i in ids]
+        # Stream the cursor into typed columns rather than fetchall()'s list of tuples
+        cursor = self._connection().execute(
+            f"SELECT patient_id, date, visit_type, segment FROM visits WHERE {sql} ORDER BY date", params)
+        cursor.arraysize = 65536
+        rows = np.fromiter(itertools.chain.from_iterable(iter(cursor.fetchmany, [])), dtype=COHORT_ROW)
+        active_profiler().touch(len(rows))
+        return CohortEngine(rows['patient_id'], rows['date'].astype('datetime64[D]'),
+                            rows['visit_type'], rows['segment'])
+    
+    def _patient_history(self):
+        first = self._frame("SELECT date, clinic_id, segment, patient_id FROM visits "
+                            "WHERE visit_type = 0 AND patient_id != ?", (PATIENT_UNKNOWN,),
+                            ['date', 'clinic_id', 'segment', 'patient_id'])
+        first['date'] = first['date'].to_numpy().astype('datetime64[D]')
+        first['segment'] = self._categories(first['segment'], 'segment')
+        next_id = int(first['patient_id'].max()) + 1 if len(first) else 0
+        return first, next_id
+    
+    def append_visits(self, visits: pd.DataFrame):
+        """Add new visits, rewriting only rows from the earliest new visit's day onward"""
+        visits = self._prepare_visits(visits)
+        if visits.empty:
+            return
+        start = _epoch_day(visits['date'].iloc[0].normalize())  # the whole first day, as in memory
+        with self._writer() as conn:
+            existing = pd.DataFrame(
+                conn.execute(f"SELECT {', '.join(VISIT_DB_COLUMNS)} FROM visits WHERE date >= ?",
+                             (start,)).fetchall(), columns=VISIT_DB_COLUMNS)
+            existing['date'] = existing['date'].to_numpy().astype('datetime64[D]')
+            for col in ('segment', 'visit_type'):
+                existing[col] = self._categories(existing[col], col)
+            tail = self._merge_tail(apply_visit_schema(existing), visits)
+            conn.execute("DELETE FROM visits WHERE date >= ?", (start,))
+            _insert_visits(conn, tail)
+        
+        self.end_date = max(self.end_date, tail['date'].iloc[-1].to_pydatetime())
+        self.n_clinics = max(self.n_clinics, int(tail['clinic_id'].max()) + 1)
+        for month in tail['date'].dt.to_period('M').unique():
+            self.invalidate(month)
+    
+    def set_wait_model(self, wait_model):
+        """Swap the wait-time model and rewrite the wait_time column
+        
+        Slot-load models (SLOT + curve) run in SQL: load per clinic × slot,
+        then one UPDATE joined to the per-slot waits. Any other callable gets
+        the whole table and the result is written back.
+        """
+        if hasattr(wait_model, 'SLOT') and hasattr(wait_model, 'curve'):
+            keys = ['clinic_id'] + list(wait_model.SLOT)
+            columns = ', '.join(keys)
+            slots = self._frame(f"SELECT {columns}, COUNT(*) FROM visits GROUP BY {columns}", (), keys + ['load'])
+            slots['wait'] = wait_model.curve(slots['load'].to_numpy()).astype(np.int64)
+            match = ' AND '.join(f"s.{k} = visits.{k}" for k in keys)
+            with self._writer() as conn:
+                conn.execute(f"CREATE TEMP TABLE slot_wait ({columns}, wait INTEGER, PRIMARY KEY ({columns}))")
+                conn.executemany(f"INSERT INTO slot_wait VALUES ({', '.join('?' * (len(keys) + 1))})",
+                                 slots[keys + ['wait']].itertuples(index=False, name=None))
+                conn.execute(f"UPDATE visits SET wait_time = (SELECT wait FROM slot_wait s WHERE {match})")
+        else:
+            data = self._frame(f"SELECT {', '.join(VISIT_DB_COLUMNS)} FROM visits ORDER BY rowid",
+                               (), VISIT_DB_COLUMNS)
+            data['date'] = data['date'].to_numpy().astype('datetime64[D]')
+            for col in ('segment', 'visit_type'):
+                data[col] = self._categories(data[col], col)
+            data = apply_visit_schema(data)
+            data['wait_time'] = wait_model(data).astype(VISIT_SCHEMA['wait_time'])
+            with self._writer() as conn:
+                conn.execute("DELETE FROM visits")
+                _insert_visits(conn, data)
+        self.wait_model = wait_model
+        self.invalidate()
+
+@dataclass(frozen=True)
+class DatasetSnapshot:
+    """One immutable generation of the dataset"""
+    dm: DataManager
+    version: int
+    token: object
+    built_at: datetime
+    build_seconds: float
+
+class DatasetRefresher:
+    """Rebuilds the dataset off the request path and swaps it in atomically
+    
+    Double-buffered: the next DataManager (table, index, rollup cube and any
+    ``warm`` aggregates) is built on a background thread while readers keep
+    using the current snapshot; publishing is one reference assignment.
+    ``token()`` identifies the source (a date, a file fingerprint); it is
+    polled every ``interval`` seconds and a change triggers ``build(token)``.
+    Readers should call snapshot() once per render and use it throughout.
+    """
+    
+    def __init__(self, build, token=lambda: None, interval: float = 60.0,
+                 max_age: float = None, warm=None):
+        self._build = build
+        self._token = token
+        self.interval = interval
+        self.max_age = max_age
+        self._warm = warm
+        self.last_error = None
+        self._forced = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._snapshot = self._build_snapshot(1, token())
+        self._thread = threading.Thread(target=self._run, name='dataset-refresher', daemon=True)
+        self._thread.start()
+    
+    def snapshot(self) -> DatasetSnapshot:
+        return self._snapshot
+    
+    def refresh_now(self):
+        """Rebuild on the background thread even if the source is unchanged"""
+        self._forced = True
+        self._wake.set()
+    
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+    
+    def _stale(self, token) -> bool:
+        snap = self._snapshot
+        if token != snap.token:
+            return True
+        return self.max_age is not None and (datetime.now() - snap.built_at).total_seconds() >= self.max_age
+    
+    def _build_snapshot(self, version: int, token) -> DatasetSnapshot:
+        start = time.perf_counter()
+        dm = self._build(token)
+        if self._warm:
+            self._warm(dm)
+        return DatasetSnapshot(dm, version, token, datetime.now(), time.perf_counter() - start)
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                token = self._token()
+                if self._forced or self._stale(token):
+                    self._forced = False
+                    self._snapshot = self._build_snapshot(self._snapshot.version + 1, token)
+                    self.last_error = None
+            except Exception as exc:
+                self.last_error = exc
+                logging.getLogger('dashboard.refresh').exception("dataset refresh failed")
+
+# ------------------------------------------------------------
+# Scenario engine: Monte Carlo capacity / wait-time what-ifs
+# ------------------------------------------------------------
+
+SCENARIO_PERCENTILES = [5, 25, 50, 75, 95]
+
+@dataclass
+class Scenario:
+    """What-if adjustments on a Mon–Sat × HOURS grid
+    
+    ``volume`` multiplies expected arrivals per slot; ``capacity`` is doctors
+    on duty per slot (baseline 1), dividing the load the wait curve sees.
+    """
+    name: str = 'ベースライン'
+    volume: np.ndarray = None
+    capacity: np.ndarray = None
+    
+    def __post_init__(self):
+        shape = (len(WEEKDAY_LABELS), len(DataManager.HOURS))
+        self.volume = np.ones(shape) if self.volume is None else np.asarray(self.volume, dtype=float)
+        self.capacity = np.ones(shape) if self.capacity is None else np.asarray(self.capacity, dtype=float)
+    
+    @staticmethod
+    def _mask(weekdays=None, hours=None) -> np.ndarray:
+        rows = np.isin(np.arange(len(WEEKDAY_LABELS)), list(range(6)) if weekdays is None else list(weekdays))
+        cols = np.isin(DataManager.HOURS, DataManager.HOURS if hours is None else list(hours))
+        return rows[:, None] & cols[None, :]
+    
+    def with_volume(self, factor: float, weekdays=None, hours=None, name: str = None) -> 'Scenario':
+        """Arrivals × factor on the given weekdays (0=Mon) and hours (default: all)"""
+        volume = np.where(self._mask(weekdays, hours), self.volume * factor, self.volume)
+        return Scenario(name or self.name, volume, self.capacity.copy())
+    
+    def with_doctors(self, extra: float, weekdays=None, hours=None, name: str = None) -> 'Scenario':
+        """``extra`` more doctors on duty on the given weekdays and hours"""
+        capacity = np.where(self._mask(weekdays, hours), self.capacity + extra, self.capacity)
+        return Scenario(name or self.name, self.volume.copy(), capacity)
+
+@dataclass
+class SimulationResult:
+    """Simulated months for one scenario"""
+    scenario: Scenario
+    month: pd.Period
+    samples: pd.DataFrame        # one row per simulated month: visits, revenue, wait_time
+    dates: pd.DatetimeIndex
+    daily_visits: np.ndarray     # (n_sims, days)
+    daily_wait: np.ndarray       # (n_sims, days), visit-weighted mean wait
+    seconds: float
+    
+    def bands(self, percentiles=SCENARIO_PERCENTILES) -> pd.DataFrame:
+        """Percentiles of each monthly metric (rows: visits, revenue, wait_time)"""
+        bands = self.samples.quantile(np.asarray(percentiles) / 100).T
+        bands.columns = [f"p{p}" for p in percentiles]
+        return bands
+    
+    def daily_bands(self, metric: str = 'wait_time', percentiles=(10, 50, 90)) -> pd.DataFrame:
+        """Per-day percentiles of visits or wait_time across simulations"""
+        values = self.daily_wait if metric == 'wait_time' else self.daily_visits
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN days: closed in the scenario
+            bands = np.nanpercentile(values, percentiles, axis=0)
+        return pd.DataFrame({'date': self.dates, **{f"p{p}": b for p, b in zip(percentiles, bands)}})
+
+class ScenarioEngine:
+    """Monte Carlo months from DataManager's arrival model and a wait curve
+    
+    Every simulated month is drawn at once as (simulation, day[, hour])
+    arrays: daily volume from the weekday/rain-adjusted Poisson, segment
+    mix and hourly split as batched multinomials, and monthly revenue from
+    the per-segment moments of the generator's clipped normal. Wait time is
+    the wait model's curve at its own slot grain (day or hour), with each
+    hour's load divided by the scenario's capacity. Baseline and scenario
+    runs share one seed, so their difference is not sampling noise.
+    """
+    
+    def __init__(self, model=DataManager, wait_model=None, seed: int = 0):
+        self.model = model
+        self.wait_model = wait_model or DailyLoadWaitModel()
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        moments = []
+        for segment in model.SEGMENTS:
+            mean, std, lo, hi = model.REVENUE_PARAMS[segment]
+            draws = np.clip(rng.normal(mean, std, 100_000).astype(np.int64), lo, hi)
+            moments.append((draws.mean(), draws.var()))
+        self._revenue_mean, self._revenue_var = np.array(moments).T
+    
+    def simulate(self, month: pd.Period, scenario: Scenario = None, n_sims: int = 2000) -> SimulationResult:
+        start = time.perf_counter()
+        m = self.model
+        scenario = scenario or Scenario()
+        rng = np.random.default_rng([self.seed, month.ordinal])
+        
+        dates = pd.date_range(month.start_time, month.end_time.normalize(), freq='D')
+        dates = dates[dates.weekday != 6]
+        weekday = dates.weekday.to_numpy()
+        
+        # Scenario volume scales each day's expected total and reshapes its hourly split;
+        # a day the scenario closes (all-zero volume) keeps the baseline split for its 0 visits
+        hour_prob = np.asarray(m.HOUR_PROB, dtype=float)
+        slot_weight = hour_prob * scenario.volume[weekday]
+        day_weight = slot_weight.sum(axis=1, keepdims=True)
+        day_factor = day_weight[:, 0] / hour_prob.sum()
+        day_hour_prob = np.where(day_weight > 0, slot_weight / np.where(day_weight > 0, day_weight, 1),
+                                 hour_prob / hour_prob.sum())
+        
+        # Only the generator's floor carries over (scaled with the day): its
+        # ceiling would cap every what-if that adds volume
+        weekday_coef = np.array([m.WEEKDAY_COEF.get(w, 1.0) for w in range(7)])[weekday]
+        rain = np.where(rng.random((n_sims, len(dates))) < m.RAIN_PROB, m.RAIN_COEF, 1.0)
+        arrivals = np.maximum(rng.poisson(m.BASE_LAMBDA * weekday_coef * day_factor * rain),
+                              np.floor(m.DAILY_MIN * day_factor).astype(np.int64))
+        
+        winter = np.isin(dates.month.to_numpy(), m.WINTER_MONTHS)
+        segment_prob = np.where(winter[:, None], m.SEGMENT_PROB_WINTER, m.SEGMENT_PROB)
+        segments = rng.multinomial(arrivals, segment_prob)
+        segments[..., m.SEGMENTS.index('checkup')] *= weekday == 5  # checkups only on Saturdays
+        visits = segments.sum(axis=-1)
+        slots = rng.multinomial(visits, day_hour_prob)
+        
+        per_segment = segments.sum(axis=1)
+        revenue = rng.normal(per_segment @ self._revenue_mean, np.sqrt(per_segment @ self._revenue_var))
+        
+        load = slots / scenario.capacity[weekday]
+        if 'hour' in self.wait_model.SLOT:
+            wait_minutes = (self.wait_model.curve(load) * slots).sum(axis=-1)
+        else:
+            wait_minutes = self.wait_model.curve(load.sum(axis=-1)) * visits
+        
+        # Mean waits over no visits are NaN (a closed day), not a division warning
+        with np.errstate(invalid='ignore', divide='ignore'):
+            samples = pd.DataFrame({
+                'visits': visits.sum(axis=1),
+                'revenue': revenue,
+                'wait_time': wait_minutes.sum(axis=1) / visits.sum(axis=1)
+            })
+            daily_wait = (wait_minutes / visits).astype(np.float32)
+        return SimulationResult(scenario, month, samples, dates, visits.astype(np.int32),
+                                daily_wait, time.perf_counter() - start)
 
 # ============================================================
-# 4. UI COMPONENTS
+# 5. UI COMPONENTS
 # ============================================================
 
 def render_premium_header():
@@ -520,37 +2442,97 @@ def render_kpi_card(icon: str, label: str, value: str, delta: float,
     </div>
     """
 
+def render_kpi_cards(kpis: dict, revenue_label: str = "今月の売上") -> list:
+    """The four KPI cards (revenue, visits, wait time, first-visit rate) as HTML"""
+    return [
+        render_kpi_card("fas fa-yen-sign", revenue_label, f"¥{kpis['revenue']['value']:,.0f}", 
+                        kpis['revenue']['delta'], COLOR.CHART_1),
+        render_kpi_card("fas fa-users", "来院数", f"{kpis['visits']['value']:,}人", 
+                        kpis['visits']['delta'], COLOR.CHART_2),
+        render_kpi_card("fas fa-clock", "平均待ち時間", f"{kpis['wait_time']['value']:.0f}分", 
+                        kpis['wait_time']['delta'], COLOR.CHART_3, inverse=True),
+        render_kpi_card("fas fa-user-plus", "初診率", f"{kpis['first_rate']['value']:.1f}%", 
+                        kpis['first_rate']['delta'], COLOR.CHART_4)
+    ]
+
 # ============================================================
-# 5. PLOTLY CHARTS (BUG-FREE)
+# 6. PLOTLY CHARTS (BUG-FREE)
 # ============================================================
 
-def create_dual_axis_chart(daily_data: pd.DataFrame) -> go.Figure:
-    """Bug-free dual-axis chart"""
+# Above this many daily points the trend switches to downsampled WebGL traces
+TREND_POINT_BUDGET = 400
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of n_out shape-preserving points"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Interior buckets split points 1..n-2; first and last points are always kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        nxt_lo, nxt_hi = hi, edges[b + 2] if b + 2 < len(edges) else n
+        avg_x, avg_y = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[prev] - avg_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (avg_y - y[prev]))
+        prev = lo + int(area.argmax())
+        keep[b + 1] = prev
+    return keep
+
+def create_dual_axis_chart(daily_data: pd.DataFrame, max_points: int = TREND_POINT_BUDGET) -> go.Figure:
+    """Bug-free dual-axis chart
+    
+    Ranges longer than ``max_points`` days are LTTB-downsampled on the server
+    (both series on one shared set of dates) and drawn with Scattergl, so the
+    payload stays bounded.
+    """
     fig = go.Figure()
+    long_range = len(daily_data) > max_points
+    scatter = go.Scattergl if long_range else go.Scatter
+    date_format = '%Y/%m/%d' if long_range else '%m/%d'
+    
+    # One shared x sample, so 'x unified' hover pairs each date's visits and revenue:
+    # the union of each series' LTTB points at half the budget
+    dates = daily_data['date'].to_numpy()
+    keep = np.arange(len(daily_data))
+    if long_range:
+        t = dates.astype('datetime64[s]').astype(np.int64)
+        keep = np.union1d(*(lttb_indices(t, daily_data[col].to_numpy(), max_points // 2)
+                            for col in ('visits', 'revenue')))
+    x = dates[keep]
+    
+    def series(column):
+        return daily_data[column].to_numpy()[keep]
     
     # Area chart with proper rgba format
-    fig.add_trace(go.Scatter(
-        x=daily_data['date'],
-        y=daily_data['visits'],
+    y = series('visits')
+    fig.add_trace(scatter(
+        x=x,
+        y=y,
         name='来院数',
         mode='lines',
-        line=dict(color='rgb(14, 165, 233)', width=3),
+        line=dict(color='rgb(14, 165, 233)', width=2 if long_range else 3),
         fill='tozeroy',
         fillcolor='rgba(14, 165, 233, 0.2)',
         yaxis='y',
-        hovertemplate='<b>%{x|%m/%d}</b><br><span style="font-size:15px;color:rgb(14,165,233);font-weight:700;">来院数: %{y}人</span><extra></extra>'
+        hovertemplate=f'<b>%{{x|{date_format}}}</b><br><span style="font-size:15px;color:rgb(14,165,233);font-weight:700;">来院数: %{{y}}人</span><extra></extra>'
     ))
     
     # Line chart
-    fig.add_trace(go.Scatter(
-        x=daily_data['date'],
-        y=daily_data['revenue'],
+    y = series('revenue')
+    fig.add_trace(scatter(
+        x=x,
+        y=y,
         name='売上',
-        mode='lines+markers',
-        line=dict(color='rgb(139, 92, 246)', width=3),
+        mode='lines' if long_range else 'lines+markers',
+        line=dict(color='rgb(139, 92, 246)', width=2 if long_range else 3),
         marker=dict(size=7, color='rgb(139, 92, 246)'),
         yaxis='y2',
-        hovertemplate='<b>%{x|%m/%d}</b><br><span style="font-size:15px;color:rgb(139,92,246);font-weight:700;">売上: ¥%{y:,.0f}</span><extra></extra>'
+        hovertemplate=f'<b>%{{x|{date_format}}}</b><br><span style="font-size:15px;color:rgb(139,92,246);font-weight:700;">売上: ¥%{{y:,.0f}}</span><extra></extra>'
     ))
     
     fig.update_layout(
@@ -578,13 +2560,13 @@ def create_dual_axis_chart(daily_data: pd.DataFrame) -> go.Figure:
     
     return fig
 
-def create_heatmap(heatmap_data: pd.DataFrame) -> go.Figure:
+def create_heatmap(heatmap_data: pd.DataFrame, metric: str = 'visits') -> go.Figure:
     """Bug-free heatmap"""
-    weekday_labels = ['月', '火', '水', '木', '金', '土']
+    title, value_format = HEATMAP_METRICS[metric]
     
     fig = go.Figure(data=go.Heatmap(
         z=heatmap_data.values,
-        x=[weekday_labels[i] for i in heatmap_data.columns],
+        x=[WEEKDAY_LABELS[i] for i in heatmap_data.columns],
         y=[f"{h}:00" for h in heatmap_data.index],
         colorscale=[
             [0, 'rgb(240, 249, 255)'],
@@ -597,8 +2579,8 @@ def create_heatmap(heatmap_data: pd.DataFrame) -> go.Figure:
         showscale=True,
         xgap=2,
         ygap=2,
-        hovertemplate='<b>%{x} %{y}</b><br><span style="font-size:15px;color:rgb(14,165,233);font-weight:700;">来院数: %{z}人</span><extra></extra>',
-        colorbar=dict(title=dict(text='来院数', font=dict(size=12)), thickness=15, len=0.7)
+        hovertemplate=f'<b>%{{x}} %{{y}}</b><br><span style="font-size:15px;color:rgb(14,165,233);font-weight:700;">{title}: {value_format}</span><extra></extra>',
+        colorbar=dict(title=dict(text=title, font=dict(size=12)), thickness=15, len=0.7)
     ))
     
     fig.update_layout(
@@ -636,14 +2618,32 @@ def create_donut(segment_data: pd.DataFrame) -> go.Figure:
     
     return fig
 
-def create_histogram(age_data: pd.DataFrame) -> go.Figure:
-    """Bug-free histogram"""
-    fig = go.Figure(data=[go.Histogram(
-        x=age_data['age'],
-        nbinsx=13,
-        marker=dict(color='rgb(139, 92, 246)', line=dict(color='white', width=2)),
-        hovertemplate='<b>年齢: %{x}</b><br><span style="font-size:15px;color:rgb(139,92,246);font-weight:700;">人数: %{y}人</span><extra></extra>'
-    )])
+def create_histogram(age_bins: pd.DataFrame) -> go.Figure:
+    """Bug-free histogram, drawn as bars from server-side bins (get_age_histogram)
+    
+    Empty bins at either end are trimmed; a ``segment`` column stacks one
+    trace per segment.
+    """
+    totals = age_bins.groupby('age_from', sort=True)['count'].sum()
+    nonzero = totals.index[totals.to_numpy() > 0]
+    if len(nonzero):
+        age_bins = age_bins[age_bins['age_from'].between(nonzero.min(), nonzero.max())]
+    
+    colors = ['rgb(14, 165, 233)', 'rgb(139, 92, 246)', 'rgb(236, 72, 153)']
+    groups = age_bins.groupby('segment', sort=False) if 'segment' in age_bins else [(None, age_bins)]
+    traces = []
+    for i, (segment, bins) in enumerate(groups):
+        color = 'rgb(139, 92, 246)' if segment is None else colors[i % len(colors)]
+        traces.append(go.Bar(
+            x=(bins['age_from'] + bins['age_to']) / 2,
+            y=bins['count'],
+            name=segment,
+            customdata=[f"{lo}–{hi - 1}" for lo, hi in zip(bins['age_from'], bins['age_to'])],
+            marker=dict(color=color, line=dict(color='white', width=2)),
+            hovertemplate=f'<b>年齢: %{{customdata}}</b><br><span style="font-size:15px;color:{color};font-weight:700;">人数: %{{y}}人</span><extra></extra>'
+        ))
+    fig = go.Figure(data=traces)
+    fig.update_layout(barmode='stack', showlegend=len(traces) > 1)
     
     fig.update_layout(
         font=dict(family="Inter, Noto Sans JP, sans-serif", color=COLOR.TEXT_PRIMARY),
@@ -666,52 +2666,419 @@ def create_histogram(age_data: pd.DataFrame) -> go.Figure:
     
     return fig
 
+def create_scenario_chart(baseline: SimulationResult, scenario: SimulationResult) -> go.Figure:
+    """Daily wait time: 10–90% band and median for baseline vs scenario"""
+    fig = go.Figure()
+    for result, rgb in ((baseline, (148, 163, 184)), (scenario, (14, 165, 233))):
+        bands = result.daily_bands('wait_time')
+        name = result.scenario.name
+        fig.add_trace(go.Scatter(
+            x=np.concatenate([bands['date'], bands['date'][::-1]]),
+            y=np.concatenate([bands['p90'], bands['p10'][::-1]]),
+            fill='toself',
+            fillcolor=f'rgba{rgb + (0.18,)}',
+            line=dict(width=0),
+            hoverinfo='skip',
+            showlegend=False
+        ))
+        fig.add_trace(go.Scatter(
+            x=bands['date'],
+            y=bands['p50'],
+            name=name,
+            mode='lines+markers',
+            line=dict(color=f'rgb{rgb}', width=3),
+            marker=dict(size=6, color=f'rgb{rgb}'),
+            customdata=np.stack([bands['p10'], bands['p90']], axis=-1),
+            hovertemplate=f'<b>%{{x|%m/%d}}</b><br><span style="font-size:15px;color:rgb{rgb};font-weight:700;">{name}: %{{y:.0f}}分</span> (%{{customdata[0]:.0f}}–%{{customdata[1]:.0f}})<extra></extra>'
+        ))
+    
+    fig.update_layout(
+        font=dict(family="Inter, Noto Sans JP, sans-serif", color=COLOR.TEXT_PRIMARY),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(t=20, b=40, l=60, r=20),
+        hovermode='x unified',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5),
+        yaxis=dict(
+            title=dict(text='平均待ち時間（分）', font=dict(size=13, weight=600)),
+            showgrid=True,
+            gridcolor=COLOR.BORDER,
+            zeroline=False
+        ),
+        xaxis=dict(showgrid=False, showline=True, linecolor=COLOR.BORDER)
+    )
+    
+    return fig
+
+def create_retention_heatmap(cohort_counts: pd.DataFrame) -> go.Figure:
+    """Cohort × months-since-first-visit retention (get_retention_matrix(rate=False))
+    
+    Cells show the share of the cohort seen that month; months no cohort
+    has reached yet are trimmed.
+    """
+    cohort_counts = cohort_counts.dropna(axis=1, how='all')
+    sizes = cohort_counts[0].to_numpy()
+    rates = cohort_counts.to_numpy() / sizes[:, None] * 100
+    
+    fig = go.Figure(data=go.Heatmap(
+        z=rates,
+        x=[f"{k}ヶ月後" if k else "初診月" for k in cohort_counts.columns],
+        y=[f"{c.strftime('%Y年%m月')}（{n:,.0f}人）" for c, n in zip(cohort_counts.index, sizes)],
+        text=[["" if np.isnan(v) else f"{v:.0f}%" for v in row] for row in rates],
+        texttemplate='%{text}',
+        customdata=cohort_counts.to_numpy(),
+        colorscale=[
+            [0, 'rgb(240, 249, 255)'],
+            [0.2, 'rgb(186, 230, 253)'],
+            [0.4, 'rgb(125, 211, 252)'],
+            [0.6, 'rgb(56, 189, 248)'],
+            [0.8, 'rgb(14, 165, 233)'],
+            [1, 'rgb(3, 105, 161)']
+        ],
+        zmin=0,
+        zmax=100,
+        xgap=2,
+        ygap=2,
+        hovertemplate='<b>%{y} · %{x}</b><br><span style="font-size:15px;color:rgb(14,165,233);font-weight:700;">継続率: %{z:.1f}%（%{customdata:,.0f}人）</span><extra></extra>',
+        colorbar=dict(title=dict(text='継続率（%）', font=dict(size=12)), thickness=15, len=0.7)
+    ))
+    
+    fig.update_layout(
+        font=dict(family="Inter, Noto Sans JP, sans-serif", color=COLOR.TEXT_PRIMARY),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(t=20, b=40, l=60, r=20),
+        xaxis=dict(side='top', showgrid=False),
+        yaxis=dict(showgrid=False, autorange='reversed')
+    )
+    
+    return fig
+
+def create_revisit_chart(intervals: pd.DataFrame) -> go.Figure:
+    """Stacked revisit-interval bars per segment (get_revisit_intervals)"""
+    colors = ['rgb(14, 165, 233)', 'rgb(139, 92, 246)', 'rgb(236, 72, 153)']
+    traces = []
+    for i, (segment, bins) in enumerate(intervals.groupby('segment', sort=False)):
+        traces.append(go.Bar(
+            x=bins['interval'],
+            y=bins['count'],
+            name=segment,
+            marker=dict(color=colors[i % len(colors)], line=dict(color='white', width=2)),
+            hovertemplate=f'<b>{segment} · 前回から%{{x}}</b><br><span style="font-size:15px;color:{colors[i % len(colors)]};font-weight:700;">%{{y}}件</span><extra></extra>'
+        ))
+    fig = go.Figure(data=traces)
+    
+    fig.update_layout(
+        barmode='stack',
+        font=dict(family="Inter, Noto Sans JP, sans-serif", color=COLOR.TEXT_PRIMARY),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(t=20, b=40, l=60, r=20),
+        legend=dict(orientation='h', yanchor='bottom', y=1.02, x=0),
+        xaxis=dict(
+            title=dict(text='前回来院からの間隔', font=dict(size=13, weight=600)),
+            showgrid=False,
+            showline=True,
+            linecolor=COLOR.BORDER
+        ),
+        yaxis=dict(
+            title=dict(text='再来院数（件）', font=dict(size=13, weight=600)),
+            showgrid=True,
+            gridcolor=COLOR.BORDER
+        ),
+        bargap=0.1
+    )
+    
+    return fig
+
+def _payload_nbytes(value) -> int:
+    """Bytes held in the array-valued properties of a plotly JSON-like structure"""
+    if isinstance(value, dict):
+        return sum(_payload_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple, np.ndarray, pd.Series, pd.Index)):
+        return int(np.asarray(value).nbytes)
+    return 0
+
+@dataclass
+class CachedFigure:
+    """A built figure and the size of its data arrays
+    
+    st.plotly_chart serializes the figure itself on every call, so the cache
+    saves the build, not the JSON; entries are weighed by their trace data.
+    """
+    figure: go.Figure
+    nbytes: int
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """Content hash of a DataFrame (values, index, columns and dtypes)"""
+    h = hashlib.sha1()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    h.update(repr(df.index.names).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+FIGURE_CACHE_BYTES = 64 * 1024 * 1024
+
+@st.cache_resource(show_spinner=False)
+def _figure_cache() -> LRUCache:
+    """Process-wide figure cache, shared across reruns and sessions"""
+    return LRUCache(maxsize=1024, max_weight=FIGURE_CACHE_BYTES, weigh=lambda entry: entry.nbytes)
+
+@functools.lru_cache(maxsize=None)
+def _code_digest(code) -> str:
+    """Hash of a code object's bytecode, constants and nested code (not just co_code)"""
+    return hashlib.sha1(marshal.dumps(code)).hexdigest()
+
+def cached_figure(builder, data: pd.DataFrame, **options) -> CachedFigure:
+    """Build (or reuse) builder(data, **options), keyed by the builder's code, a hash of data and options"""
+    key = (builder.__name__, _code_digest(builder.__code__), frame_digest(data), tuple(sorted(options.items())))
+    
+    def build():
+        fig = builder(data, **options)
+        return CachedFigure(fig, sum(_payload_nbytes(trace.to_plotly_json()) for trace in fig.data))
+    
+    return _figure_cache().get_or_compute(key, build)
+
 # ============================================================
-# 6. MAIN APPLICATION
+# 7. MAIN APPLICATION
 # ============================================================
 
-def main():
-    """Main application - Bug-Free Version"""
+def render_debug_panel(profiler: RenderProfiler, snap: DatasetSnapshot):
+    """Hidden per-stage timing panel (?debug=1)"""
+    dm = snap.dm
+    with st.expander("🛠 Render profile", expanded=True):
+        st.dataframe(profiler.frame(), use_container_width=True, hide_index=True)
+        st.caption(
+            f"dataset v{snap.version} · built {snap.built_at:%H:%M:%S} in {snap.build_seconds:.2f}s · "
+            f"{dm.row_count():,} rows"
+        )
+        st.caption(
+            f"aggregate cache: {dm.cache.stats()} · figure cache: {_figure_cache().stats()}"
+        )
+
+# Trend spans offered next to the month selector (24 months exceeds TREND_POINT_BUDGET days)
+TREND_SPANS = [1, 3, 6, 12, 24]
+
+class Prefetcher:
+    """Warms aggregates and figures for months the user is likely to open next
     
-    inject_god_tier_styles()
+    One background worker; a (dataset version, month, span, heatmap metric) is not queued
+    again while it is pending. Finished entries are dropped, so a later
+    request re-warms cheaply from the caches.
+    """
     
-    dm = DataManager(months_back=6)
-    current_month = pd.Period(datetime.now(), freq='M')
-    kpis = dm.get_kpi_summary(current_month)
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        self._pending = set()
+        self._lock = threading.Lock()
     
-    # HEADER
-    render_premium_header()
+    def submit(self, snap: DatasetSnapshot, month: pd.Period, trend_months: int, heatmap_metric: str = 'visits'):
+        key = (snap.version, month, trend_months, heatmap_metric)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        future = self._pool.submit(self._warm, snap.dm, month, trend_months, heatmap_metric)
+        future.add_done_callback(lambda _: self._done(key))
     
-    # KPI CARDS
-    col1, col2, col3, col4 = st.columns(4, gap="large")
+    def _done(self, key):
+        with self._lock:
+            self._pending.discard(key)
     
-    with col1:
-        st.markdown(
-            render_kpi_card("fas fa-yen-sign", "今月の売上", f"¥{kpis['revenue']['value']:,.0f}", 
-                          kpis['revenue']['delta'], COLOR.CHART_1),
-            unsafe_allow_html=True
-        )
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
     
-    with col2:
-        st.markdown(
-            render_kpi_card("fas fa-users", "来院数", f"{kpis['visits']['value']:,}人", 
-                          kpis['visits']['delta'], COLOR.CHART_2),
-            unsafe_allow_html=True
-        )
+    @staticmethod
+    def _warm(dm: DataManager, month: pd.Period, trend_months: int, heatmap_metric: str):
+        try:
+            warm_month(dm, month, trend_months, heatmap_metric)
+        except Exception:
+            logging.getLogger('dashboard.prefetch').exception("prefetch failed for %s", month)
+
+@st.cache_resource(show_spinner=False)
+def _prefetcher() -> Prefetcher:
+    return Prefetcher()
+
+def warm_month(dm: DataManager, month: pd.Period, trend_months: int = 1, heatmap_metric: str = 'visits'):
+    """Compute one month's view (aggregates and figures) into the caches"""
+    dm.get_kpi_summary(month)
+    cached_figure(create_dual_axis_chart, dm.get_daily_trend(month, months=trend_months))
+    cached_figure(create_heatmap, dm.get_heatmap_data(month, metric=heatmap_metric), metric=heatmap_metric)
+    cached_figure(create_donut, dm.get_segment_distribution(month))
+    cached_figure(create_histogram, dm.get_age_histogram(month))
+
+def _warm_latest(dm: DataManager):
+    months = dm.available_months()
+    if months:
+        warm_month(dm, months[-1])
+        dm.get_retention_matrix()  # builds the cohort engine off the request path
+
+# Months of synthetic history: enough for the longest TREND_SPANS entry
+LIVE_MONTHS_BACK = 24
+
+@st.cache_resource(show_spinner=False)
+def live_dataset() -> DatasetRefresher:
+    """The dashboard's dataset, rebuilt in the background
     
-    with col3:
-        st.markdown(
-            render_kpi_card("fas fa-clock", "平均待ち時間", f"{kpis['wait_time']['value']:.0f}分", 
-                          kpis['wait_time']['delta'], COLOR.CHART_3, inverse=True),
-            unsafe_allow_html=True
+    DASHBOARD_SHARED=<dir> maps the generation a loader process published
+    there (publish_dataset.py) and remaps when a new one appears;
+    DASHBOARD_SQLITE=<file> queries a visit database (SQLiteDataManager.build)
+    without loading it; DASHBOARD_EXPORT=<csv/parquet> serves that export and
+    reloads it when the file changes; otherwise synthetic data rolls over to a
+    new day at midnight.
+    """
+    shared = os.environ.get('DASHBOARD_SHARED')
+    if shared:
+        return DatasetRefresher(
+            lambda generation: DataManager.from_shared(shared, generation),
+            token=lambda: current_generation(shared), interval=5.0, warm=_warm_latest
         )
-    
-    with col4:
-        st.markdown(
-            render_kpi_card("fas fa-user-plus", "初診率", f"{kpis['first_rate']['value']:.1f}%", 
-                          kpis['first_rate']['delta'], COLOR.CHART_4),
-            unsafe_allow_html=True
+    database = os.environ.get('DASHBOARD_SQLITE')
+    if database:
+        return DatasetRefresher(lambda _: SQLiteDataManager(database),
+                                token=lambda: export_fingerprint(database), warm=_warm_latest)
+    export = os.environ.get('DASHBOARD_EXPORT')
+    if export:
+        return DatasetRefresher(
+            lambda _: DataManager.from_export(export, cache_dir=TABLE_CACHE_DIR),
+            token=lambda: export_fingerprint(export), warm=_warm_latest
         )
+    return DatasetRefresher(
+        lambda as_of: DataManager(LIVE_MONTHS_BACK, 42, end_date=datetime.combine(as_of, datetime.min.time()),
+                                  cache_dir=TABLE_CACHE_DIR),
+        token=date.today, warm=_warm_latest
+    )
+
+# Hour groups offered by the scenario form
+SCENARIO_PERIODS = {'終日': None, '午前': [9, 10, 11, 12], '午後': [14, 15, 16, 17]}
+
+@st.fragment
+def render_scenario_panel(dm, month: pd.Period):
+    """Monte Carlo what-if form for month; submitting reruns only this fragment
+    
+    Called from render_month_view, so a new month selection reruns it with
+    the new month (a rerun of this fragment alone keeps the last arguments).
+    """
+    with st.expander(f"🔮 シナリオ分析（{month.strftime('%Y年%m月')}・モンテカルロ）"):
+        with st.form('scenario'):
+            col_volume, col_doctor, col_runs = st.columns(3)
+            with col_volume:
+                volume_days = st.multiselect("来院数を変える曜日", range(6), default=[0],
+                                             format_func=WEEKDAY_LABELS.__getitem__)
+                volume_pct = st.slider("来院数の増減（%）", -50, 100, 20, step=5)
+            with col_doctor:
+                doctor_days = st.multiselect("医師を増やす曜日", range(6), default=[3],
+                                             format_func=WEEKDAY_LABELS.__getitem__)
+                doctor_period = st.radio("時間帯", list(SCENARIO_PERIODS), index=2, horizontal=True)
+                doctors = st.number_input("追加する医師（人）", 0, 5, 1)
+            with col_runs:
+                n_sims = st.select_slider("試行回数", [500, 1000, 2000, 5000], value=2000)
+            submitted = st.form_submit_button("シミュレーション実行")
+        
+        if submitted:
+            scenario = Scenario('シナリオ')
+            if volume_days and volume_pct:
+                scenario = scenario.with_volume(1 + volume_pct / 100, weekdays=volume_days)
+            if doctor_days and doctors:
+                scenario = scenario.with_doctors(doctors, weekdays=doctor_days,
+                                                 hours=SCENARIO_PERIODS[doctor_period])
+            engine = ScenarioEngine(type(dm), dm.wait_model)
+            st.session_state['scenario_results'] = (
+                engine.simulate(month, Scenario(), n_sims),
+                engine.simulate(month, scenario, n_sims)
+            )
+        
+        results = st.session_state.get('scenario_results')
+        if results is None or results[0].month != month:
+            return
+        baseline, scenario = results
+        labels = {'visits': '来院数（人）', 'revenue': '売上（円）', 'wait_time': '平均待ち時間（分）'}
+        base, alt = baseline.bands(), scenario.bands()
+        st.dataframe(pd.DataFrame({
+            'ベースライン（中央値）': base['p50'],
+            'シナリオ（中央値）': alt['p50'],
+            'シナリオ 5–95%': [f"{lo:,.0f} – {hi:,.0f}" for lo, hi in zip(alt['p5'], alt['p95'])],
+            '差（中央値）': alt['p50'] - base['p50']
+        }).rename(index=labels).round(1), use_container_width=True)
+        st.plotly_chart(create_scenario_chart(baseline, scenario), use_container_width=True,
+                        config={'displayModeBar': False})
+        st.caption(f"{baseline.month.strftime('%Y年%m月')} · {len(scenario.samples):,} 試行 × 2 シナリオ · "
+                   f"{baseline.seconds + scenario.seconds:.2f}秒")
+
+def render_cohort_panel(dm, month: pd.Period):
+    """First-visit cohort retention, and revisit intervals for month (part of render_month_view)"""
+    with st.expander("👥 患者リテンション（初診コホート）"):
+        cohort_counts = dm.get_retention_matrix(rate=False)
+        if cohort_counts.empty:
+            st.info("このデータには患者IDがないため、コホート分析はできません。")
+            return
+        col_retention, col_interval = st.columns([3, 2])
+        with col_retention:
+            st.markdown('<div class="graph-title"><i class="fas fa-users"></i>月次継続率（初診月別）</div>',
+                        unsafe_allow_html=True)
+            st.plotly_chart(cached_figure(create_retention_heatmap, cohort_counts).figure,
+                            use_container_width=True, config={'displayModeBar': False})
+        with col_interval:
+            st.markdown(f'<div class="graph-title"><i class="fas fa-redo"></i>再来院間隔'
+                        f'（{month.strftime("%Y年%m月")}）</div>', unsafe_allow_html=True)
+            st.plotly_chart(cached_figure(create_revisit_chart, dm.get_revisit_intervals(month)).figure,
+                            use_container_width=True, config={'displayModeBar': False})
+        st.caption("初診から追跡できる患者のみ集計（データ開始前からの通院患者は除外）")
+
+def main():
+    """Main application - Bug-Free Version"""
+    
+    prof = RenderProfiler() if profiling_requested() else NULL_PROFILER
+    set_active_profiler(prof)
+    try:
+        with prof.stage('styles'):
+            inject_god_tier_styles()
+        
+        # HEADER
+        with prof.stage('header'):
+            render_premium_header()
+        
+        render_month_view()
+    finally:
+        set_active_profiler(NULL_PROFILER)
+
+@st.fragment
+def render_month_view():
+    """Month-scoped part of the page; changing the selector reruns only this"""
+    previous = active_profiler()
+    prof = previous
+    if prof is NULL_PROFILER and profiling_requested():
+        prof = RenderProfiler()  # fragment rerun: main() did not run
+    set_active_profiler(prof)
+    try:
+        _render_month_view(prof)
+    finally:
+        set_active_profiler(previous)
+
+def _render_month_view(prof):
+    with prof.stage('data'):
+        snap = live_dataset().snapshot()  # one consistent generation for the whole render
+    dm = snap.dm
+    months = dm.available_months()
+    
+    # MONTH SELECTOR
+    col_month, col_span, _ = st.columns([1, 1, 2])
+    with col_month:
+        month = st.selectbox("対象月", months[::-1], format_func=lambda p: p.strftime('%Y年%m月'),
+                             key='target_month')
+    with col_span:
+        trend_months = st.radio("トレンド期間", TREND_SPANS, format_func=lambda n: f"{n}ヶ月",
+                                horizontal=True, key='trend_months')
+    
+    with prof.stage('kpi'):
+        kpis = dm.get_kpi_summary(month)
+    revenue_label = "今月の売上" if month == months[-1] else f"{month.month}月の売上"
+    
+    # KPI CARDS
+    for col, card in zip(st.columns(4, gap="large"), render_kpi_cards(kpis, revenue_label)):
+        with col:
+            st.markdown(card, unsafe_allow_html=True)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
@@ -720,16 +3087,24 @@ def main():
     
     with col_left:
         st.markdown('<div class="graph-container animate-fade-in-up"><div class="graph-title"><i class="fas fa-chart-line"></i>売上 & 来院数トレンド</div>', unsafe_allow_html=True)
-        daily_trend = dm.get_daily_trend(current_month)
-        fig_dual = create_dual_axis_chart(daily_trend)
-        st.plotly_chart(fig_dual, use_container_width=True, config={'displayModeBar': False})
+        daily_trend = dm.get_daily_trend(month, months=trend_months)
+        with prof.stage('figure.trend'):
+            fig_dual = cached_figure(create_dual_axis_chart, daily_trend)
+        prof.chart('trend', fig_dual.nbytes)
+        with prof.stage('send.trend'):
+            st.plotly_chart(fig_dual.figure, use_container_width=True, config={'displayModeBar': False})
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col_right:
         st.markdown('<div class="graph-container animate-fade-in-up"><div class="graph-title"><i class="fas fa-fire"></i>混雑ヒートマップ</div>', unsafe_allow_html=True)
-        heatmap_data = dm.get_heatmap_data(current_month)
-        fig_heatmap = create_heatmap(heatmap_data)
-        st.plotly_chart(fig_heatmap, use_container_width=True, config={'displayModeBar': False})
+        heatmap_metric = st.radio("指標", list(HEATMAP_METRICS), format_func=lambda m: HEATMAP_METRICS[m][0],
+                                  horizontal=True, key='heatmap_metric', label_visibility='collapsed')
+        heatmap_data = dm.get_heatmap_data(month, metric=heatmap_metric)
+        with prof.stage('figure.heatmap'):
+            fig_heatmap = cached_figure(create_heatmap, heatmap_data, metric=heatmap_metric)
+        prof.chart('heatmap', fig_heatmap.nbytes)
+        with prof.stage('send.heatmap'):
+            st.plotly_chart(fig_heatmap.figure, use_container_width=True, config={'displayModeBar': False})
         st.markdown('</div>', unsafe_allow_html=True)
     
     # DONUT & HISTOGRAM
@@ -737,17 +3112,37 @@ def main():
     
     with col_left:
         st.markdown('<div class="graph-container animate-fade-in-up"><div class="graph-title"><i class="fas fa-chart-pie"></i>疾患別構成比</div>', unsafe_allow_html=True)
-        segment_data = dm.get_segment_distribution(current_month)
-        fig_donut = create_donut(segment_data)
-        st.plotly_chart(fig_donut, use_container_width=True, config={'displayModeBar': False})
+        segment_data = dm.get_segment_distribution(month)
+        with prof.stage('figure.donut'):
+            fig_donut = cached_figure(create_donut, segment_data)
+        prof.chart('donut', fig_donut.nbytes)
+        with prof.stage('send.donut'):
+            st.plotly_chart(fig_donut.figure, use_container_width=True, config={'displayModeBar': False})
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col_right:
         st.markdown('<div class="graph-container animate-fade-in-up"><div class="graph-title"><i class="fas fa-chart-bar"></i>年齢分布</div>', unsafe_allow_html=True)
-        age_data = dm.get_age_distribution(current_month)
-        fig_age = create_histogram(age_data)
-        st.plotly_chart(fig_age, use_container_width=True, config={'displayModeBar': False})
+        age_data = dm.get_age_histogram(month)
+        with prof.stage('figure.age'):
+            fig_age = cached_figure(create_histogram, age_data)
+        prof.chart('age', fig_age.nbytes)
+        with prof.stage('send.age'):
+            st.plotly_chart(fig_age.figure, use_container_width=True, config={'displayModeBar': False})
         st.markdown('</div>', unsafe_allow_html=True)
+    
+    with prof.stage('scenario'):
+        render_scenario_panel(dm, month)
+    with prof.stage('cohort'):
+        render_cohort_panel(dm, month)
+    
+    # Neighbouring months are the likeliest next selections
+    for neighbour in (month - 1, month + 1):
+        if neighbour in months:
+            _prefetcher().submit(snap, neighbour, trend_months, heatmap_metric)
+    
+    # Last, so the report covers every stage of this render
+    if st.query_params.get('debug') == '1':
+        render_debug_panel(prof, snap)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,184 @@
+"""
+Headless benchmark for DataManager queries and chart builders
+
+Runs without launching Streamlit. Each (months, clinics) scale runs in its
+own spawned process so peak RSS is per scale.
+
+Usage:
+    python bench.py --out bench.json
+    python bench.py --quick --compare bench.json --threshold 0.25
+"""
+
+import argparse
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+QUERIES = [
+    'get_kpi_summary',
+    'get_daily_trend',
+    'get_heatmap_data',
+    'get_segment_distribution',
+    'get_age_distribution',
+    'get_age_histogram',
+    'get_revisit_intervals'  # includes the cohort engine build (invalidated per run)
+]
+
+# builder -> getter that feeds it
+CHARTS = {
+    'create_dual_axis_chart': 'get_daily_trend',
+    'create_heatmap': 'get_heatmap_data',
+    'create_donut': 'get_segment_distribution',
+    'create_histogram': 'get_age_histogram'
+}
+
+FULL_MATRIX = {'months': [6, 12, 60, 120], 'clinics': [1, 10, 100]}
+QUICK_MATRIX = {'months': [6, 12], 'clinics': [1, 10]}
+
+# Regressions smaller than this are timer noise
+MIN_DELTA_SECONDS = 0.002
+
+def _timed(fn, repeat: int, setup=None):
+    """Median wall time of fn over repeat runs, and its last result"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+def run_scale(months: int, clinics: int, repeat: int, as_of: str) -> dict:
+    """Benchmark one (months, clinics) point; runs inside a worker process"""
+    import app
+
+    end_date = datetime.combine(date.fromisoformat(as_of), datetime.min.time())
+    kwargs = dict(months_back=months, n_clinics=clinics, end_date=end_date)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    construct, dm = _timed(lambda: app.DataManager(**kwargs), 1)
+
+    month = pd.Period(end_date, freq='M') - 1
+    timings = {'construct': construct}
+    results = {}
+    for name in QUERIES:
+        timings[name], results[name] = _timed(
+            lambda: getattr(dm, name)(month), repeat, setup=dm.invalidate
+        )
+
+    payload_bytes = {}
+    for builder, source in CHARTS.items():
+        timings[builder], fig = _timed(lambda: getattr(app, builder)(results[source]), repeat)
+        timings[f'{builder}.to_json'], payload = _timed(fig.to_json, repeat)
+        payload_bytes[builder] = len(payload.encode())
+
+    return {
+        'months': months,
+        'clinics': clinics,
+        'rows': len(dm.data),
+        'table_bytes': int(dm.data.memory_usage(deep=True).sum()),
+        'timings': timings,
+        'payload_bytes': payload_bytes,
+        'baseline_rss_mb': rss_before,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def run_matrix(matrix: dict, repeat: int, as_of: str) -> dict:
+    results = []
+    for months in matrix['months']:
+        for clinics in matrix['clinics']:
+            # Fresh process per scale so peak RSS is not inherited
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                result = pool.submit(run_scale, months, clinics, repeat, as_of).result()
+            results.append(result)
+            print(f"{months:>4} months × {clinics:>3} clinics: {result['rows']:>10,} rows, "
+                  f"construct {result['timings']['construct']:.3f}s, "
+                  f"peak RSS {result['peak_rss_mb']:.0f} MB", file=sys.stderr)
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'as_of': as_of,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine()
+        },
+        'results': results
+    }
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Timing metrics slower than baseline by more than threshold (fraction)"""
+    base = {(r['months'], r['clinics']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        ref = base.get((result['months'], result['clinics']))
+        if ref is None:
+            continue
+        for metric, seconds in result['timings'].items():
+            before = ref['timings'].get(metric)
+            if before is None:
+                continue
+            if seconds > before * (1 + threshold) and seconds - before > MIN_DELTA_SECONDS:
+                regressions.append({
+                    'months': result['months'],
+                    'clinics': result['clinics'],
+                    'metric': metric,
+                    'baseline': before,
+                    'current': seconds,
+                    'ratio': seconds / before
+                })
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--months', type=int, nargs='+', help='history lengths to run')
+    parser.add_argument('--clinics', type=int, nargs='+', help='clinic counts to run')
+    parser.add_argument('--quick', action='store_true', help='small matrix for smoke runs')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per query (median)')
+    parser.add_argument('--as-of', default=date.today().isoformat(), help='dataset end date (YYYY-MM-DD)')
+    parser.add_argument('--out', help='write JSON results here (default: stdout)')
+    parser.add_argument('--compare', metavar='BASELINE', help='flag regressions against a saved run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown before flagging')
+    args = parser.parse_args()
+
+    matrix = dict(QUICK_MATRIX if args.quick else FULL_MATRIX)
+    if args.months:
+        matrix['months'] = args.months
+    if args.clinics:
+        matrix['clinics'] = args.clinics
+
+    report = run_matrix(matrix, args.repeat, args.as_of)
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report['regressions'] = compare(report, baseline, args.threshold)
+        for r in report['regressions']:
+            print(f"REGRESSION {r['months']}m×{r['clinics']}c {r['metric']}: "
+                  f"{r['baseline'] * 1000:.1f}ms -> {r['current'] * 1000:.1f}ms ({r['ratio']:.2f}x)",
+                  file=sys.stderr)
+        status = 1 if report['regressions'] else 0
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Build the self-hosted static asset bundle
+
+Downloads the dashboard's web fonts (subset to the glyphs app.py can render)
+and Font Awesome, rewrites their stylesheets to point at local copies, and
+writes everything to ./static with content-hashed file names plus
+static/manifest.json. app.py serves the bundle instead of the CDNs whenever
+the manifest exists (Streamlit static serving is enabled in
+.streamlit/config.toml).
+
+Run once per deploy on a machine with internet access:
+    python build_assets.py
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import shutil
+import string
+import sys
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+STATIC_DIR = ROOT / 'static'
+
+GOOGLE_FONTS_CSS = 'https://fonts.googleapis.com/css2'
+FONT_FAMILIES = [
+    'Inter:wght@400;500;600;700;800;900',
+    'Noto+Sans+JP:wght@400;500;600;700'
+]
+FONT_AWESOME_CSS = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css'
+
+# Google Fonts only serves woff2 to browsers it recognises
+USER_AGENT = ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+
+URL_PATTERN = re.compile(r'url\((["\']?)([^)"\']+)\1\)')
+
+def fetch(url: str) -> bytes:
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.read()
+
+def rendered_glyphs(sources) -> str:
+    """Every character the dashboard can put on screen: ASCII plus app.py's text"""
+    chars = set(string.printable.strip()) | {' '}
+    for path in sources:
+        chars |= {c for c in Path(path).read_text(encoding='utf-8') if ord(c) > 127 and c.isprintable()}
+    return ''.join(sorted(chars))
+
+def hashed_name(stem: str, suffix: str, payload: bytes) -> str:
+    return f"{stem}.{hashlib.sha256(payload).hexdigest()[:12]}{suffix}"
+
+def localize_stylesheet(css_url: str, name: str, out_dir: Path) -> str:
+    """Download every url() a stylesheet references and rewrite it to the local copy"""
+    css = fetch(css_url).decode('utf-8')
+    fonts_dir = out_dir / 'fonts'
+    fonts_dir.mkdir(parents=True, exist_ok=True)
+    local = {}
+
+    def replace(match):
+        ref = match.group(2)
+        if ref.startswith('data:'):
+            return match.group(0)
+        absolute = urllib.parse.urljoin(css_url, ref)
+        if absolute not in local:
+            payload = fetch(absolute)
+            path = Path(urllib.parse.urlparse(absolute).path)
+            filename = hashed_name(path.stem or 'font', path.suffix, payload)
+            (fonts_dir / filename).write_bytes(payload)
+            local[absolute] = f"fonts/{filename}"
+        return f"url({local[absolute]})"
+
+    css = URL_PATTERN.sub(replace, css)
+    payload = css.encode('utf-8')
+    filename = hashed_name(name, '.css', payload)
+    (out_dir / filename).write_bytes(payload)
+    print(f"  {filename}: {len(local)} files", file=sys.stderr)
+    return filename
+
+def build(out_dir: Path, glyph_sources) -> dict:
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+
+    glyphs = rendered_glyphs(glyph_sources)
+    query = '&'.join(f"family={family}" for family in FONT_FAMILIES)
+    fonts_url = f"{GOOGLE_FONTS_CSS}?{query}&display=swap&text={urllib.parse.quote(glyphs)}"
+
+    stylesheets = [
+        localize_stylesheet(fonts_url, 'fonts', out_dir),
+        localize_stylesheet(FONT_AWESOME_CSS, 'icons', out_dir)
+    ]
+    manifest = {
+        'built': datetime.now().isoformat(timespec='seconds'),
+        'glyphs': len(glyphs),
+        'stylesheets': stylesheets
+    }
+    (out_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', type=Path, default=STATIC_DIR, help='output directory (default: ./static)')
+    parser.add_argument('--glyphs-from', nargs='+', default=[ROOT / 'app.py'],
+                        help='source files whose characters the font subset must cover')
+    args = parser.parse_args()
+
+    manifest = build(args.out, args.glyphs_from)
+    print(json.dumps(manifest, indent=2))
+
+if __name__ == "__main__":
+    main()
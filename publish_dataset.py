@@ -0,0 +1,64 @@
+"""
+Loader process for multi-process deployments
+
+Builds the visit table and rollup cube once and publishes them as a
+generation of .npy files under --root (default /dev/shm/clinic-dashboard,
+i.e. shared memory). Streamlit workers started with DASHBOARD_SHARED=<root>
+memory-map the current generation read-only instead of each holding a
+private copy, and remap when a new generation is published.
+
+Usage:
+    python publish_dataset.py                       # publish once
+    python publish_dataset.py --watch               # republish daily / on change
+    python publish_dataset.py --export visits.csv --watch
+    DASHBOARD_SHARED=/dev/shm/clinic-dashboard streamlit run app.py
+"""
+
+import argparse
+import sys
+import time
+from datetime import date, datetime
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', default=None, help='publish directory (default: /dev/shm/clinic-dashboard)')
+    parser.add_argument('--export', help='CSV/Parquet visit export (default: synthetic data)')
+    parser.add_argument('--months', type=int, default=6, help='synthetic history length')
+    parser.add_argument('--clinics', type=int, default=1, help='synthetic clinic count')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep', type=int, default=2, help='generations kept for workers still remapping')
+    parser.add_argument('--watch', action='store_true', help='keep running and republish when the source changes')
+    parser.add_argument('--interval', type=float, default=60.0, help='seconds between source checks')
+    args = parser.parse_args()
+
+    import app
+
+    root = args.root or app.SHARED_DATASET_DIR
+
+    def publish(dm):
+        name = app.publish_generation(dm, root, keep=args.keep)
+        print(f"{datetime.now():%H:%M:%S} published {name}: {len(dm.data):,} rows "
+              f"({dm.data.memory_usage().sum() / 1e6:.1f} MB table, {dm.cube.nbytes() / 1e6:.1f} MB cube)",
+              file=sys.stderr)
+
+    if args.export:
+        build = lambda _: app.DataManager.from_export(args.export, cache_dir=app.TABLE_CACHE_DIR)
+        token = lambda: app.export_fingerprint(args.export)
+    else:
+        build = lambda as_of: app.DataManager(args.months, args.seed, n_clinics=args.clinics,
+                                              end_date=datetime.combine(as_of, datetime.min.time()),
+                                              cache_dir=app.TABLE_CACHE_DIR)
+        token = date.today
+
+    refresher = app.DatasetRefresher(build, token=token, interval=args.interval, warm=publish)
+    if not args.watch:
+        refresher.stop()
+        return
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        refresher.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Headless batch generator for monthly executive HTML reports
+
+Renders one report per (clinic, month) with the dashboard's KPI cards and
+charts, without launching Streamlit. Reports are built across a process
+pool; every worker maps the same on-disk table cache instead of
+regenerating the data, and all reports share a single plotly.min.js
+written next to them (--inline-js embeds it instead, for email).
+
+Usage:
+    python report.py --clinics 10 --months 3 --out reports/
+    python report.py --clinics 0 2 5 --months 2026-08 2026-09 --inline-js
+"""
+
+import argparse
+import html
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from multiprocessing import get_context
+from pathlib import Path
+
+import pandas as pd
+
+PLOTLY_JS = 'plotly.min.js'
+
+# (title, icon, builder, getter, grid span) in dashboard order
+SECTIONS = [
+    ('売上 & 来院数トレンド', 'fa-chart-line', 'create_dual_axis_chart', 'get_daily_trend', 2),
+    ('混雑ヒートマップ', 'fa-fire', 'create_heatmap', 'get_heatmap_data', 1),
+    ('疾患別構成比', 'fa-chart-pie', 'create_donut', 'get_segment_distribution', 1),
+    ('年齢分布', 'fa-chart-bar', 'create_histogram', 'get_age_histogram', 2)
+]
+
+PAGE = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+{assets}
+{css}
+<style>
+    body {{ background: {background}; margin: 0; padding: 2rem 3rem; }}
+    .report-grid {{ display: grid; grid-template-columns: repeat(3, minmax(0, 1fr)); gap: 1.5rem; }}
+    .report-grid .kpi-row {{ grid-column: span 3; display: grid; grid-template-columns: repeat(4, 1fr); gap: 1.5rem; }}
+    .span-1 {{ grid-column: span 1; }}
+    .span-2 {{ grid-column: span 2; }}
+</style>
+{script}
+</head>
+<body>
+{header}
+<div class="report-grid">
+<div class="kpi-row">{cards}</div>
+{sections}
+</div>
+</body>
+</html>
+"""
+
+HEADER = """
+<div class="dashboard-header">
+    <div class="clinic-logo">
+        <i class="fas fa-hospital-alt clinic-icon"></i>
+        <div>
+            <h1 class="clinic-title">Metro Central Internal Medicine</h1>
+            <p class="clinic-subtitle">Monthly Executive Summary · Clinic {clinic} · {month}</p>
+        </div>
+    </div>
+    <div class="last-updated">
+        <div class="last-updated-label">GENERATED</div>
+        <div class="last-updated-time">{generated}</div>
+    </div>
+</div>
+"""
+
+_worker = {}
+
+def _init_worker(dm_kwargs: dict, out_dir: str, inline_js: bool):
+    """Per-process setup: load the shared table cache and the page chrome once"""
+    import app
+
+    _worker['app'] = app
+    _worker['dm'] = app.DataManager(**dm_kwargs, cache_dir=app.TABLE_CACHE_DIR)
+    _worker['out'] = Path(out_dir)
+    _worker['css'] = app.design_css()
+    if inline_js:
+        from plotly.offline import get_plotlyjs
+        _worker['script'] = f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    else:
+        _worker['script'] = f'<script src="{PLOTLY_JS}"></script>'
+
+def render_report(clinic: int, month: pd.Period) -> str:
+    """One clinic × month report as a complete HTML document"""
+    app, dm = _worker['app'], _worker['dm']
+    kpis = dm.get_kpi_summary(month, clinic)
+    cards = ''.join(app.render_kpi_cards(kpis, f"{month.month}月の売上"))
+
+    sections = []
+    for title, icon, builder, getter, span in SECTIONS:
+        fig = getattr(app, builder)(getattr(dm, getter)(month, clinic))
+        chart = fig.to_html(full_html=False, include_plotlyjs=False, config={'displayModeBar': False})
+        sections.append(
+            f'<div class="graph-container span-{span}"><div class="graph-title">'
+            f'<i class="fas {icon}"></i>{html.escape(title)}</div>{chart}</div>'
+        )
+
+    return PAGE.format(
+        title=f"Clinic {clinic} · {month.strftime('%Y年%m月')}",
+        assets=app.CDN_ASSET_LINKS,
+        css=_worker['css'],
+        background=app.COLOR.BG_PRIMARY,
+        script=_worker['script'],
+        header=HEADER.format(clinic=clinic, month=month.strftime('%Y年%m月'),
+                             generated=datetime.now().strftime('%Y年%m月%d日 %H:%M')),
+        cards=cards,
+        sections='\n'.join(sections)
+    )
+
+def write_report(task) -> tuple:
+    clinic, month = task
+    page = render_report(clinic, month)
+    path = _worker['out'] / f"clinic{clinic:03d}_{month.strftime('%Y-%m')}.html"
+    path.write_text(page, encoding='utf-8')
+    return str(path), len(page.encode('utf-8'))
+
+def resolve_months(spec: list, as_of: date) -> list:
+    """['3'] -> last 3 complete months; otherwise explicit YYYY-MM months"""
+    if len(spec) == 1 and spec[0].isdigit():
+        last = pd.Period(as_of, freq='M') - 1
+        return list(pd.period_range(last - (int(spec[0]) - 1), last, freq='M'))
+    return [pd.Period(m, freq='M') for m in spec]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clinics', type=int, nargs='+', default=[1],
+                        help='clinic count, or explicit clinic ids when more than one value')
+    parser.add_argument('--months', nargs='+', default=['1'],
+                        help='number of complete months back, or explicit YYYY-MM months')
+    parser.add_argument('--as-of', default=date.today().isoformat(), help='dataset end date (YYYY-MM-DD)')
+    parser.add_argument('--history', type=int, default=6, help='months of data to generate')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None, help='report processes (default: CPU count)')
+    parser.add_argument('--inline-js', action='store_true', help='embed Plotly JS in every report')
+    parser.add_argument('--out', type=Path, default=Path('reports'), help='output directory')
+    args = parser.parse_args()
+
+    as_of = date.fromisoformat(args.as_of)
+    clinics = list(range(args.clinics[0])) if len(args.clinics) == 1 else args.clinics
+    months = resolve_months(args.months, as_of)
+    tasks = [(clinic, month) for clinic in clinics for month in months]
+
+    dm_kwargs = dict(months_back=args.history, seed=args.seed, n_clinics=max(clinics) + 1,
+                     end_date=datetime.combine(as_of, datetime.min.time()))
+    args.out.mkdir(parents=True, exist_ok=True)
+    if not args.inline_js:
+        from plotly.offline import get_plotlyjs
+        (args.out / PLOTLY_JS).write_text(get_plotlyjs(), encoding='utf-8')
+
+    start = time.perf_counter()
+    # Build (or validate) the on-disk table once so workers only map it
+    _init_worker(dm_kwargs, str(args.out), args.inline_js)
+    setup = time.perf_counter() - start
+
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(dm_kwargs, str(args.out), args.inline_js)) as pool:
+        results = list(pool.map(write_report, tasks, chunksize=max(1, len(tasks) // 64)))
+    elapsed = time.perf_counter() - start
+
+    total_bytes = sum(size for _, size in results)
+    summary = {
+        'reports': len(results),
+        'clinics': len(clinics),
+        'months': [str(m) for m in months],
+        'seconds': elapsed,
+        'setup_seconds': setup,
+        'reports_per_second': len(results) / elapsed if elapsed else 0.0,
+        'bytes': total_bytes,
+        'out': str(args.out)
+    }
+    print(f"{len(results)} reports in {elapsed:.2f}s "
+          f"({summary['reports_per_second']:.1f} reports/s, {total_bytes / 1e6:.1f} MB)", file=sys.stderr)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
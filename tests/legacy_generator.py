@@ -0,0 +1,86 @@
+"""
+The original per-visit loop DataManager._generate_data replaced
+
+Kept as the reference for the generator's distribution tests and for
+time_generate.py. Identical to the loop it replaced except that end_date
+and the global NumPy seed are parameters.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+def legacy_generate_data(months_back: int, seed: int, end_date) -> pd.DataFrame:
+    np.random.seed(seed)
+    start_date = end_date - timedelta(days=30 * months_back)
+    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
+    records = []
+    
+    for date in date_range:
+        if date.weekday() == 6:
+            continue
+        
+        base_lambda = 60
+        weekday_coef = {0: 1.2, 3: 0.6, 5: 0.6}.get(date.weekday(), 1.0)
+        rain_coef = 0.8 if np.random.random() < 0.05 else 1.0
+        
+        adjusted_lambda = base_lambda * weekday_coef * rain_coef
+        daily_patients = int(np.random.poisson(adjusted_lambda))
+        daily_patients = max(15, min(95, daily_patients))
+        
+        for _ in range(daily_patients):
+            segment_prob = [0.4, 0.5, 0.1]
+            if date.month in [12, 1, 2]:
+                segment_prob = [0.35, 0.6, 0.05]
+            
+            segment = np.random.choice(['lifestyle', 'acute', 'checkup'], p=segment_prob)
+            
+            if segment == 'lifestyle':
+                revenue = int(np.random.normal(5000, 1200))
+                revenue = max(3000, min(9000, revenue))
+                visit_type = '再診' if np.random.random() < 0.85 else '初診'
+            elif segment == 'acute':
+                revenue = int(np.random.normal(2800, 600))
+                revenue = max(1800, min(5000, revenue))
+                visit_type = '初診' if np.random.random() < 0.35 else '再診'
+            else:
+                if date.weekday() != 5:
+                    continue
+                revenue = int(np.random.normal(16000, 2500))
+                revenue = max(12000, min(22000, revenue))
+                visit_type = '検診'
+            
+            age_params = {
+                'lifestyle': (58, 12),
+                'acute': (40, 18),
+                'checkup': (47, 10)
+            }
+            age = int(np.random.normal(*age_params[segment]))
+            age = max(22, min(82, age))
+            
+            hour = np.random.choice(
+                [9, 10, 11, 12, 14, 15, 16, 17],
+                p=[0.08, 0.16, 0.24, 0.09, 0.11, 0.21, 0.08, 0.03]
+            )
+            
+            records.append({
+                'date': date,
+                'segment': segment,
+                'visit_type': visit_type,
+                'age': age,
+                'revenue': revenue,
+                'hour': hour,
+                'weekday': date.weekday()
+            })
+    
+    df = pd.DataFrame(records)
+    df['date'] = pd.to_datetime(df['date'])
+    
+    daily_counts = df.groupby('date').size()
+    df['wait_time'] = df['date'].map(
+        lambda d: int(((daily_counts.get(d, 0) / 60) ** 2) * 35)
+    )
+    df['wait_time'] = df['wait_time'].clip(8, 135)
+    
+    return df
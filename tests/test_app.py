@@ -0,0 +1,62 @@
+"""Page-level checks through Streamlit's AppTest"""
+
+import json
+from pathlib import Path
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from app import HEATMAP_METRICS, TREND_POINT_BUDGET, TREND_SPANS
+
+APP = Path(__file__).resolve().parents[1] / 'app.py'
+
+@pytest.fixture
+def app_test():
+    return AppTest.from_file(str(APP), default_timeout=120).run()
+
+def expander_labels(at) -> list:
+    return [e.label for e in at.expander]
+
+def revisit_titles(at) -> list:
+    return [m.value for m in at.markdown if '再来院間隔' in m.value]
+
+def test_panels_follow_selected_month(app_test):
+    at = app_test
+    assert not at.exception
+    selector = at.selectbox(key='target_month')
+    latest, previous = selector.options[:2]
+    assert any(latest in label for label in expander_labels(at))
+    assert any(latest in title for title in revisit_titles(at))
+    selector.select_index(1).run()
+    assert not at.exception
+    assert any(previous in label for label in expander_labels(at))
+    assert not any(latest in label for label in expander_labels(at))
+    assert any(previous in title for title in revisit_titles(at))
+    assert not any(latest in title for title in revisit_titles(at))
+
+def test_longest_trend_span_is_downsampled(app_test):
+    at = app_test
+    at.radio(key='trend_months').set_value(max(TREND_SPANS)).run()
+    assert not at.exception
+    visits, revenue = json.loads(at.get('plotly_chart')[0].proto.spec)['data']
+    assert visits['type'] == revenue['type'] == 'scattergl'
+    assert visits['x'] == revenue['x']
+    assert len(visits['x']) <= TREND_POINT_BUDGET
+
+@pytest.mark.parametrize('metric', list(HEATMAP_METRICS))
+def test_heatmap_metric_selector(app_test, metric):
+    at = app_test
+    at.radio(key='heatmap_metric').set_value(metric).run()
+    assert not at.exception
+    heatmap = json.loads(at.get('plotly_chart')[1].proto.spec)['data'][0]
+    assert heatmap['type'] == 'heatmap'
+    assert heatmap['colorbar']['title']['text'] == HEATMAP_METRICS[metric][0]
+
+def test_debug_profile_covers_every_stage():
+    at = AppTest.from_file(str(APP), default_timeout=120)
+    at.query_params['debug'] = '1'
+    at.run()
+    assert not at.exception
+    assert at.expander[-1].label == "🛠 Render profile"
+    stages = at.dataframe[-1].value['stage'].tolist()
+    assert {'kpi', 'send.trend', 'send.age', 'scenario', 'cohort', 'dm.get_revisit_intervals'} <= set(stages)
@@ -0,0 +1,61 @@
+"""DataManager.append_visits / append_day against a full rebuild"""
+
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import DataManager, RollupCube
+
+END = datetime(2026, 10, 18)
+
+@pytest.fixture(scope='module')
+def full():
+    return DataManager(months_back=2, seed=6, end_date=END, n_clinics=2)
+
+def split_last_day(full):
+    last = full.data['date'].max()
+    head = full.data[full.data['date'] < last].reset_index(drop=True)
+    day = full.data[full.data['date'] == last].reset_index(drop=True)
+    return head, day
+
+def assert_same_as_rebuild(dm, data):
+    pd.testing.assert_frame_equal(dm.data, data)
+    rebuilt = RollupCube(data)
+    pd.testing.assert_frame_equal(dm.cube.cells, rebuilt.cells)
+    pd.testing.assert_frame_equal(dm.cube.age_cells, rebuilt.age_cells)
+    np.testing.assert_array_equal(dm.cube.age_hist, rebuilt.age_hist)
+
+def test_append_day_matches_rebuild(full):
+    head, day = split_last_day(full)
+    dm = DataManager(data=head)
+    dm.append_visits(day.drop(columns=['wait_time']))  # the wait model fills the new day
+    assert_same_as_rebuild(dm, full.data)
+    month = pd.Period(day['date'].iloc[0], 'M')
+    assert dm.get_kpi_summary(month) == full.get_kpi_summary(month)
+
+def test_append_in_pieces_matches_rebuild(full):
+    head, day = split_last_day(full)
+    dm = DataManager(data=head)
+    for piece in np.array_split(np.arange(len(day)), 3):
+        dm.append_visits(day.iloc[piece])  # measured waits
+    assert_same_as_rebuild(dm, full.data)
+
+def test_append_keeps_measured_waits_of_existing_rows(full):
+    head, day = split_last_day(full)
+    first, second = day.iloc[:len(day) // 2], day.iloc[len(day) // 2:]
+    dm = DataManager(data=pd.concat([head, first.assign(wait_time=999)], ignore_index=True))
+    dm.append_visits(second.drop(columns=['wait_time']))
+    same_day = dm.data[dm.data['date'] == day['date'].iloc[0]]
+    assert (same_day['wait_time'].to_numpy()[:len(first)] == 999).all()
+    expected = dm.wait_model(same_day)[len(first):]
+    np.testing.assert_array_equal(same_day['wait_time'].to_numpy()[len(first):], expected)
+    assert_same_as_rebuild(dm, dm.data.copy())
+
+def test_append_day_extends_generated_history(full):
+    dm = DataManager(months_back=2, seed=6, end_date=END, n_clinics=2)
+    dm.append_day(date(2026, 10, 19))
+    assert dm.data['date'].max() == pd.Timestamp('2026-10-19')
+    pd.testing.assert_frame_equal(dm.data.iloc[:len(full.data)], full.data)
+    assert_same_as_rebuild(dm, dm.data.copy())
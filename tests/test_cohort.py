@@ -0,0 +1,30 @@
+"""Synthetic patient ids and the cohort engine"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from app import COHORT_ROW, DataManager, SQLiteDataManager
+
+END = datetime(2026, 10, 18)
+
+def test_patient_ids_fit_up_to_max_clinics():
+    dm = DataManager(months_back=1, seed=1, end_date=END, n_clinics=DataManager.MAX_CLINICS)
+    ids = dm.data['patient_id'].to_numpy()
+    assert ids.min() >= 0
+    assert ids.max() < 2**31 - 1
+
+def test_too_many_clinics_is_rejected():
+    with pytest.raises(ValueError, match=str(DataManager.MAX_CLINICS)):
+        DataManager(months_back=1, seed=1, end_date=END, n_clinics=DataManager.MAX_CLINICS + 1)
+
+def test_sqlite_cohorts_stream_typed_rows(tmp_path):
+    dm = DataManager(months_back=2, seed=4, end_date=END, n_clinics=2)
+    sq = SQLiteDataManager.build(tmp_path / 'visits.db', dm)
+    for clinic in (None, 1):
+        engine = sq._cohorts(clinic)
+        expected = dm._cohorts(clinic)
+        assert engine.first_month == expected.first_month
+        np.testing.assert_array_equal(engine.retention(rate=False), expected.retention(rate=False))
+    assert COHORT_ROW['patient_id'] == dm.data['patient_id'].dtype
@@ -0,0 +1,39 @@
+"""Figure cache: keys follow builder edits and options; entries are weighed by trace data"""
+
+import pandas as pd
+import plotly.graph_objects as go
+
+from app import HEATMAP_METRICS, cached_figure, create_heatmap
+
+def test_editing_a_builder_constant_rebuilds_the_figure():
+    data = pd.DataFrame({'x': [1, 2, 3]})
+    namespace = {'go': go}
+    source = "def chart(df):\n    return go.Figure(go.Bar(x=df['x'], marker_color={color!r}))\n"
+    
+    exec(source.format(color='red'), namespace)
+    red = cached_figure(namespace['chart'], data)
+    exec(source.format(color='blue'), namespace)  # same bytecode, different co_consts
+    blue = cached_figure(namespace['chart'], data)
+    
+    assert red.figure.data[0].marker.color == 'red'
+    assert blue.figure.data[0].marker.color == 'blue'
+    assert cached_figure(namespace['chart'], data) is blue
+
+def test_entries_are_weighed_by_trace_data_without_serializing(monkeypatch):
+    def no_json(self, *args, **kwargs):
+        raise AssertionError("cached_figure must not serialize; st.plotly_chart does")
+    monkeypatch.setattr(go.Figure, 'to_json', no_json)
+    
+    def scatter(df):
+        return go.Figure(go.Scatter(x=df['x'], y=df['y'], name='weighed'))
+    
+    data = pd.DataFrame({'x': [1, 2, 3, 4], 'y': [0.5, 1.5, 2.5, 3.5]})
+    entry = cached_figure(scatter, data)
+    assert entry.nbytes == data['x'].to_numpy().nbytes + data['y'].to_numpy().nbytes
+
+def test_builder_options_are_part_of_the_key():
+    grid = pd.DataFrame([[1.0, 2.0], [3.0, 4.0]], index=[9, 10], columns=[0, 1])
+    figures = {metric: cached_figure(create_heatmap, grid, metric=metric) for metric in HEATMAP_METRICS}
+    titles = {metric: entry.figure.data[0].colorbar.title.text for metric, entry in figures.items()}
+    assert titles == {metric: title for metric, (title, _) in HEATMAP_METRICS.items()}
+    assert cached_figure(create_heatmap, grid, metric='revenue') is figures['revenue']
@@ -0,0 +1,77 @@
+"""DataManager._generate_data: pinned seeded output and equivalence with the legacy loop"""
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from app import DataManager
+from legacy_generator import legacy_generate_data
+
+END = datetime(2026, 1, 15)
+
+def summary(df: pd.DataFrame) -> dict:
+    return {
+        'rows': len(df),
+        'revenue': int(df['revenue'].sum()),
+        'age': int(df['age'].astype(int).sum()),
+        'segment': df['segment'].astype(str).value_counts().to_dict(),
+        'visit_type': df['visit_type'].astype(str).value_counts().to_dict(),
+        'hour': df['hour'].astype(int).value_counts().to_dict(),
+        'first_revenue': df['revenue'].head(5).tolist()
+    }
+
+def test_seeded_output_is_pinned():
+    """The vectorized generator's draw order is part of its contract: same seed, same table"""
+    df = DataManager(months_back=2, seed=7, end_date=END).data
+    assert summary(df) == {
+        'rows': 2609,
+        'revenue': 9695490,
+        'age': 123007,
+        'segment': {'acute': 1619, 'lifestyle': 973, 'checkup': 17},
+        'visit_type': {'再診': 1884, '初診': 708, '検診': 17},
+        'hour': {11: 631, 15: 577, 10: 393, 14: 327, 12: 223, 9: 204, 16: 185, 17: 69},
+        'first_revenue': [5275, 2618, 4310, 4300, 3262]
+    }
+
+def test_same_seed_same_frame_for_any_worker_count():
+    kwargs = dict(months_back=2, seed=11, end_date=END, n_clinics=3)
+    serial = DataManager(**kwargs).data
+    pd.testing.assert_frame_equal(serial, DataManager(**kwargs).data)
+    pd.testing.assert_frame_equal(serial, DataManager(**kwargs, workers=2).data)
+    assert not serial['revenue'].equals(DataManager(**{**kwargs, 'seed': 12}).data['revenue'])
+
+@pytest.fixture(scope='module')
+def both():
+    """A year of data from each implementation; the legacy loop takes a few seconds"""
+    new = DataManager(months_back=12, seed=3, end_date=END).data
+    old = legacy_generate_data(12, 3, END)
+    return new, old
+
+def shares(values: pd.Series) -> pd.Series:
+    return values.astype(str).value_counts(normalize=True)
+
+def test_daily_volume_matches_legacy(both):
+    new, old = both
+    daily_new, daily_old = new.groupby('date').size(), old.groupby('date').size()
+    assert daily_new.index.equals(daily_old.index)
+    assert daily_new.mean() == pytest.approx(daily_old.mean(), rel=0.03)
+    assert daily_new.std() == pytest.approx(daily_old.std(), rel=0.1)
+
+@pytest.mark.parametrize('column', ['segment', 'visit_type', 'hour'])
+def test_category_shares_match_legacy(both, column):
+    new, old = both
+    pd.testing.assert_series_equal(shares(new[column]).sort_index(), shares(old[column]).sort_index(),
+                                   atol=0.015, check_names=False)
+
+@pytest.mark.parametrize('segment', DataManager.SEGMENTS)
+def test_segment_moments_match_legacy(both, segment):
+    new, old = both
+    a = new[new['segment'] == segment]
+    b = old[old['segment'] == segment]
+    bounds = {'revenue': DataManager.REVENUE_PARAMS[segment][2:], 'age': (DataManager.AGE_MIN, DataManager.AGE_MAX)}
+    for column, (lo, hi) in bounds.items():
+        x, y = a[column].astype(float), b[column].astype(float)
+        assert x.mean() == pytest.approx(y.mean(), rel=0.03), column
+        assert x.std() == pytest.approx(y.std(), rel=0.1), column
+        assert x.between(lo, hi).all() and y.between(lo, hi).all(), column
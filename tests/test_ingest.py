@@ -0,0 +1,105 @@
+"""Export ingestion: chunked loading, column/code mapping, rejected-row accounting"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import DataManager, load_visit_export
+
+END = datetime(2026, 10, 18)
+
+@pytest.fixture(scope='module')
+def visits():
+    """A clean export: the synthetic table with string chart numbers as patient ids"""
+    data = DataManager(months_back=1, seed=2, end_date=END, n_clinics=2).data
+    export = data.drop(columns=['weekday']).astype({'segment': str, 'visit_type': str})
+    return export.assign(patient_id='K' + data['patient_id'].astype(str))
+
+def write_csv(frame, path):
+    frame.to_csv(path, index=False)
+    return path
+
+def test_chunk_size_does_not_change_the_result(visits, tmp_path):
+    path = write_csv(visits, tmp_path / 'export.csv')
+    whole, whole_report = load_visit_export(path)
+    chunked, report = load_visit_export(path, chunksize=97)
+    pd.testing.assert_frame_equal(chunked, whole)
+    assert report.chunks == -(-len(visits) // 97)
+    assert whole_report.chunks == 1
+    assert report.rows_read == report.rows_kept == len(visits)
+    assert report.rejected == {}
+
+def test_parquet_matches_csv(visits, tmp_path):
+    csv, _ = load_visit_export(write_csv(visits, tmp_path / 'export.csv'))
+    visits.to_parquet(tmp_path / 'export.parquet', index=False)
+    parquet, report = load_visit_export(tmp_path / 'export.parquet', chunksize=500)
+    pd.testing.assert_frame_equal(parquet, csv)
+    assert report.chunks == -(-len(visits) // 500)
+
+def test_patient_ids_are_stable_across_chunks(visits, tmp_path):
+    df, _ = load_visit_export(write_csv(visits, tmp_path / 'export.csv'), chunksize=50)
+    source = visits['patient_id'].to_numpy()
+    # One dense id per chart number, in order of first appearance
+    assert df['patient_id'].nunique() == len(set(source))
+    assert df['patient_id'].min() == 0 and df['patient_id'].max() == len(set(source)) - 1
+    first = pd.Series(df['patient_id'].to_numpy()).groupby(source).nunique()
+    assert (first == 1).all()
+
+def test_column_map_and_code_mapping(visits, tmp_path):
+    renamed = visits.rename(columns={'date': '受診日', 'segment': '区分', 'age': '年齢'})
+    renamed['区分'] = renamed['区分'].map({'lifestyle': 'L', 'acute': 'A', 'checkup': 'C'})
+    renamed['visit_type'] = renamed['visit_type'].map({'初診': '1', '再診': '2', '検診': '3'})
+    path = write_csv(renamed, tmp_path / 'mapped.csv')
+    mapped, report = load_visit_export(
+        path, column_map={'受診日': 'date', '区分': 'segment', '年齢': 'age'},
+        segment_codes={'L': 'lifestyle', 'A': 'acute', 'C': 'checkup'},
+        visit_type_codes={'1': '初診', '2': '再診', '3': '検診'})
+    plain, _ = load_visit_export(write_csv(visits, tmp_path / 'plain.csv'))
+    pd.testing.assert_frame_equal(mapped, plain)
+    assert report.rejected == {}
+
+def test_missing_required_column_is_an_error(visits, tmp_path):
+    path = write_csv(visits.drop(columns=['hour']), tmp_path / 'export.csv')
+    with pytest.raises(ValueError, match='hour'):
+        load_visit_export(path)
+
+def test_invalid_rows_are_dropped_and_counted(visits, tmp_path):
+    clean = visits.assign(date=visits['date'].dt.strftime('%Y-%m-%d'))  # one date format throughout
+    bad = clean.head(7).astype({'age': object, 'hour': object})
+    bad.loc[bad.index[0], 'date'] = 'not a date'
+    bad.loc[bad.index[1], 'segment'] = 'dental'
+    bad.loc[bad.index[2], 'visit_type'] = '往診'
+    bad.loc[bad.index[3], 'age'] = 200
+    bad.loc[bad.index[4], 'hour'] = 'x'
+    bad.loc[bad.index[5], 'date'] = '2026-10-18'  # a Sunday
+    bad.loc[bad.index[6], ['segment', 'age']] = ['dental', 300]  # counted once, under its first failure
+    export = pd.concat([clean, bad], ignore_index=True)
+    df, report = load_visit_export(write_csv(export, tmp_path / 'export.csv'), chunksize=1000)
+    assert report.rejected == {'date': 1, 'segment': 2, 'visit_type': 1, 'age': 1, 'hour': 1, 'weekday': 1}
+    assert report.rows_read == len(export)
+    assert report.rows_kept == len(df) == len(visits)
+
+def test_blank_patient_ids_become_unknown(visits, tmp_path):
+    export = visits.head(10).copy()
+    export.loc[export.index[:3], 'patient_id'] = ''
+    df, report = load_visit_export(write_csv(export, tmp_path / 'export.csv'))
+    assert report.rows_kept == 10
+    assert (df['patient_id'].to_numpy()[:3] == -1).all()
+
+@pytest.mark.parametrize('column, label', [('segment', 'dental'), ('visit_type', '往診')])
+def test_unknown_categories_are_rejected_on_adoption(visits, column, label):
+    frame = visits.drop(columns=['patient_id']).copy()
+    frame.loc[frame.index[[3, 8]], column] = label
+    with pytest.raises(ValueError, match=f"2 visits have an unknown {column}"):
+        DataManager(data=frame)
+
+def test_unknown_categories_leave_an_append_untouched():
+    dm = DataManager(months_back=1, seed=2, end_date=END)
+    before = dm.data.copy()
+    day = dm.data[dm.data['date'] == dm.data['date'].max()].astype({'segment': str})
+    day = day.assign(segment=np.where(np.arange(len(day)) == 0, 'dental', day['segment']))
+    with pytest.raises(ValueError, match='dental'):
+        dm.append_visits(day)
+    pd.testing.assert_frame_equal(dm.data, before)
@@ -0,0 +1,36 @@
+"""Neighbour prefetch: keyed by dataset version, pending set drains"""
+
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+import app
+from app import DataManager, DatasetSnapshot, Prefetcher
+
+def snapshot(version: int, dm: DataManager) -> DatasetSnapshot:
+    return DatasetSnapshot(dm, version, None, datetime.now(), 0.0)
+
+def test_new_generation_is_warmed_and_pending_entries_drain(monkeypatch):
+    warmed = []
+    release = threading.Event()
+    
+    def fake_warm(dm, month, *view):
+        release.wait(5)
+        warmed.append((id(dm), month))
+    
+    monkeypatch.setattr(app, 'warm_month', fake_warm)
+    dm = DataManager(months_back=1, seed=1, end_date=datetime(2026, 1, 15))
+    month = pd.Period('2025-12', 'M')
+    prefetcher = Prefetcher()
+    
+    prefetcher.submit(snapshot(1, dm), month, 1)
+    prefetcher.submit(snapshot(1, dm), month, 1)  # duplicate while pending
+    # Same object (same id()) republished as a new generation is still warmed
+    prefetcher.submit(snapshot(2, dm), month, 1)
+    assert prefetcher.pending() == 2
+    
+    release.set()
+    prefetcher._pool.shutdown(wait=True)
+    assert len(warmed) == 2
+    assert prefetcher.pending() == 0
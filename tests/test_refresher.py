@@ -0,0 +1,90 @@
+"""DatasetRefresher: readers keep the old generation until the swap; failures keep it too"""
+
+import threading
+import time
+
+import pytest
+
+from app import DatasetRefresher
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+class Source:
+    """A token the test sets, and a build that can be held open or made to fail"""
+    
+    def __init__(self):
+        self.token = 'a'
+        self.building = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = False
+        self.warmed = []
+    
+    def build(self, token):
+        if token != 'a':  # the first build runs in the constructor
+            self.building.set()
+            assert self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("source unreadable")
+        return {'generation': token}
+    
+    def warm(self, dm):
+        self.warmed.append(dm)
+
+@pytest.fixture
+def source():
+    return Source()
+
+@pytest.fixture
+def refresher(source):
+    refresher = DatasetRefresher(source.build, token=lambda: source.token, interval=0.01, warm=source.warm)
+    yield refresher
+    source.release.set()
+    refresher.stop()
+
+def test_first_generation_is_built_and_warmed_up_front(refresher, source):
+    snap = refresher.snapshot()
+    assert (snap.version, snap.token, snap.dm) == (1, 'a', {'generation': 'a'})
+    assert source.warmed == [snap.dm]
+
+def test_readers_see_the_old_generation_until_the_swap(refresher, source):
+    old = refresher.snapshot()
+    source.release.clear()
+    source.token = 'b'
+    assert source.building.wait(5)
+    for _ in range(20):  # the rebuild is in progress: every read is the old generation
+        assert refresher.snapshot() is old
+        time.sleep(0.005)
+    source.release.set()
+    wait_for(lambda: refresher.snapshot().version == 2)
+    new = refresher.snapshot()
+    assert (new.token, new.dm) == ('b', {'generation': 'b'})
+    assert source.warmed[-1] is new.dm  # warmed before it was published
+    assert old.dm == {'generation': 'a'}  # a reader holding the old snapshot is unaffected
+
+def test_failed_refresh_keeps_the_old_generation(refresher, source):
+    old = refresher.snapshot()
+    source.fail = True
+    source.token = 'b'
+    wait_for(lambda: refresher.last_error is not None)
+    assert isinstance(refresher.last_error, RuntimeError)
+    assert refresher.snapshot() is old
+    source.fail = False  # the next poll retries and recovers
+    wait_for(lambda: refresher.snapshot().version == 2)
+    assert refresher.last_error is None
+    assert refresher.snapshot().dm == {'generation': 'b'}
+
+def test_refresh_now_rebuilds_an_unchanged_source(source):
+    source.token = 'same'
+    refresher = DatasetRefresher(source.build, token=lambda: source.token, interval=60)
+    try:
+        assert refresher.snapshot().version == 1
+        refresher.refresh_now()
+        wait_for(lambda: refresher.snapshot().version == 2)
+        assert refresher.snapshot().token == 'same'
+    finally:
+        refresher.stop()
@@ -0,0 +1,37 @@
+"""ScenarioEngine: what-ifs are not capped by the generator's bounds, closed days are valid"""
+
+import numpy as np
+import pandas as pd
+
+from app import DataManager, Scenario, ScenarioEngine
+
+MONTH = pd.Period('2026-09', 'M')
+
+def test_baseline_keeps_generator_floor():
+    result = ScenarioEngine(seed=1).simulate(MONTH, n_sims=500)
+    saturdays = result.dates.weekday == 5  # other days drop their checkup arrivals
+    assert result.daily_visits[:, saturdays].min() >= DataManager.DAILY_MIN
+
+def test_added_volume_is_not_capped():
+    engine = ScenarioEngine(seed=1)
+    busy = engine.simulate(MONTH, Scenario().with_volume(3.0, weekdays=[0]), n_sims=500)
+    mondays = busy.dates.weekday == 0
+    assert busy.daily_visits[:, mondays].max() > DataManager.DAILY_MAX
+    assert np.median(busy.daily_visits[:, mondays]) > DataManager.DAILY_MAX
+
+def test_weekday_with_zero_volume():
+    engine = ScenarioEngine(seed=1)
+    closed = engine.simulate(MONTH, Scenario().with_volume(0.0, weekdays=[2]), n_sims=200)
+    wednesdays = closed.dates.weekday == 2
+    assert (closed.daily_visits[:, wednesdays] == 0).all()
+    assert np.isnan(closed.daily_wait[:, wednesdays]).all()
+    assert np.isfinite(closed.daily_wait[:, ~wednesdays]).all()
+    assert closed.bands().notna().all().all()
+    bands = closed.daily_bands()
+    assert bands.loc[~wednesdays, 'p50'].notna().all()
+    assert closed.daily_bands('visits').loc[wednesdays, 'p90'].eq(0).all()
+
+def test_zero_volume_everywhere():
+    result = ScenarioEngine(seed=1).simulate(MONTH, Scenario().with_volume(0.0), n_sims=50)
+    assert (result.samples['visits'] == 0).all()
+    assert result.samples['wait_time'].isna().all()
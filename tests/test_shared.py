@@ -0,0 +1,69 @@
+"""Shared dataset generations: publish, map read-only, prune"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import DataManager, current_generation, publish_generation
+
+END = datetime(2026, 10, 18)
+
+def is_mapped(values) -> bool:
+    """True if the array (or a categorical's codes) is a view of an np.memmap"""
+    array = values.codes if isinstance(values, pd.Categorical) else np.asarray(values)
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+def column_values(frame: pd.DataFrame, col: str):
+    return frame[col].array._ndarray if hasattr(frame[col].array, '_ndarray') else frame[col].values
+
+@pytest.fixture(scope='module')
+def dm():
+    return DataManager(months_back=2, seed=8, end_date=END, n_clinics=2)
+
+def test_round_trip_keeps_columns_memory_mapped(dm, tmp_path):
+    name = publish_generation(dm, tmp_path)
+    assert name == 'gen-000001' and current_generation(tmp_path) == name
+    shared = DataManager.from_shared(tmp_path)
+    assert shared.generation == name
+    assert shared.data.equals(dm.data)  # assert_frame_equal would flag np.memmap vs ndarray
+    for col in shared.data.columns:
+        assert is_mapped(column_values(shared.data, col)), col
+    for col in shared.cube.cells.columns:
+        assert is_mapped(column_values(shared.cube.cells, col)), col
+    assert is_mapped(shared.cube.age_hist)
+    month = pd.Period('2026-09', 'M')
+    assert shared.get_kpi_summary(month) == dm.get_kpi_summary(month)
+    pd.testing.assert_frame_equal(shared.get_heatmap_data(month), dm.get_heatmap_data(month))
+
+def test_mapped_columns_are_read_only(dm, tmp_path):
+    publish_generation(dm, tmp_path)
+    shared = DataManager.from_shared(tmp_path)
+    with pytest.raises(ValueError):
+        np.asarray(column_values(shared.data, 'revenue'))[0] = 1
+
+def test_new_generations_move_current_and_prune_old_ones(dm, tmp_path):
+    names = [publish_generation(dm, tmp_path, keep=2) for _ in range(4)]
+    assert names == ['gen-000001', 'gen-000002', 'gen-000003', 'gen-000004']
+    assert current_generation(tmp_path) == 'gen-000004'
+    assert sorted(p.name for p in tmp_path.glob('gen-*')) == ['gen-000003', 'gen-000004']
+    assert not list(tmp_path.glob('*.tmp-*'))
+    assert DataManager.from_shared(tmp_path, generation='gen-000003').generation == 'gen-000003'
+
+def test_open_mapping_survives_pruning(dm, tmp_path):
+    publish_generation(dm, tmp_path, keep=1)
+    shared = DataManager.from_shared(tmp_path)
+    publish_generation(dm, tmp_path, keep=1)  # removes the generation `shared` maps
+    assert not (tmp_path / shared.generation).exists()
+    assert int(shared.data['revenue'].sum()) == int(dm.data['revenue'].sum())
+
+def test_missing_generation_is_an_error(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        DataManager.from_shared(tmp_path)
+    with pytest.raises(FileNotFoundError):
+        DataManager.from_shared(tmp_path, generation='gen-000009')
@@ -0,0 +1,167 @@
+"""SQLiteDataManager answers every getter exactly as the in-memory DataManager does"""
+
+import sqlite3
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from app import (HEATMAP_METRICS, VISIT_DB_COLUMNS, DataManager, DateRange, HourlyLoadWaitModel,
+                 SQLiteDataManager)
+
+END = datetime(2026, 10, 18)
+NEXT_DAY = date(2026, 10, 19)
+
+TARGETS = {
+    'month': pd.Period('2026-09', 'M'),
+    'current-month': pd.Period('2026-10', 'M'),
+    'quarter': DateRange.of(pd.Period('2026Q2', freq='Q')),
+    'arbitrary': DateRange('2026-08-10', '2026-08-20 12:00'),
+    'week-to-date': DateRange.to_date('2026-10-15'),
+    'month-to-date': DateRange.to_date('2026-10-15', freq='M')
+}
+CLINICS = {'all': None, 'one': 2, 'several': [0, 3]}
+
+@pytest.fixture(scope='module')
+def pair(tmp_path_factory):
+    dm = DataManager(months_back=12, seed=42, end_date=END, n_clinics=4)
+    return dm, SQLiteDataManager.build(tmp_path_factory.mktemp('db') / 'visits.db', dm)
+
+@pytest.fixture
+def fresh_pair(tmp_path):
+    """A small pair the test may mutate"""
+    dm = DataManager(months_back=3, seed=5, end_date=END, n_clinics=2)
+    return dm, SQLiteDataManager.build(tmp_path / 'visits.db', dm)
+
+def assert_same(a, b):
+    if isinstance(a, dict):
+        assert a.keys() == b.keys()
+        for key in a:
+            assert a[key].keys() == b[key].keys(), key
+            for field, x in a[key].items():
+                y = b[key][field]
+                assert (np.isnan(x) and np.isnan(y)) or x == pytest.approx(y, rel=1e-12), (key, field)
+    else:
+        pd.testing.assert_frame_equal(a, b, check_exact=False, rtol=1e-12)
+
+def sorted_ages(frame: pd.DataFrame) -> pd.DataFrame:
+    """Row order of the raw age list is not part of the contract"""
+    return frame.sort_values(list(frame.columns)).reset_index(drop=True)
+
+GETTERS = {
+    'kpi': lambda m, t, c: m.get_kpi_summary(t, c),
+    'daily_trend': lambda m, t, c: m.get_daily_trend(t, c),
+    'segment': lambda m, t, c: m.get_segment_distribution(t, c),
+    'ages': lambda m, t, c: sorted_ages(m.get_age_distribution(t, c)),
+    'age_histogram': lambda m, t, c: m.get_age_histogram(t, c),
+    'age_histogram_by_segment': lambda m, t, c: m.get_age_histogram(t, c, by_segment=True),
+    'clinic_breakdown': lambda m, t, c: m.get_clinic_breakdown(t, c),
+    'revisit_intervals': lambda m, t, c: m.get_revisit_intervals(t, c),
+    **{f'heatmap_{metric}': (lambda m, t, c, metric=metric: m.get_heatmap_data(t, c, metric=metric))
+       for metric in HEATMAP_METRICS}
+}
+
+@pytest.mark.parametrize('clinic', CLINICS.values(), ids=CLINICS.keys())
+@pytest.mark.parametrize('target', TARGETS.values(), ids=TARGETS.keys())
+@pytest.mark.parametrize('getter', GETTERS.values(), ids=GETTERS.keys())
+def test_getter_parity(pair, getter, target, clinic):
+    dm, sq = pair
+    assert_same(getter(dm, target, clinic), getter(sq, target, clinic))
+
+@pytest.mark.parametrize('clinic', CLINICS.values(), ids=CLINICS.keys())
+def test_multi_month_and_cohort_parity(pair, clinic):
+    dm, sq = pair
+    month = pd.Period('2026-09', 'M')
+    assert_same(dm.get_daily_trend(month, clinic, months=3), sq.get_daily_trend(month, clinic, months=3))
+    for rate in (True, False):
+        assert_same(dm.get_retention_matrix(clinic, rate=rate), sq.get_retention_matrix(clinic, rate=rate))
+
+def test_dataset_metadata(pair):
+    dm, sq = pair
+    assert sq.row_count() == len(dm.data)
+    assert sq.available_months() == dm.available_months()
+    assert (sq.n_clinics, sq.seed) == (dm.n_clinics, dm.seed)
+    # The database only knows its last visit; END itself is a closed Sunday
+    assert sq.end_date == dm.data['date'].max().to_pydatetime()
+
+def test_append_day_parity(fresh_pair):
+    dm, sq = fresh_pair
+    month = pd.Period('2026-10', 'M')
+    sq.get_kpi_summary(month)  # warm the cache so the append has to invalidate it
+    dm.append_day(NEXT_DAY)
+    sq.append_day(NEXT_DAY)
+    assert sq.row_count() == len(dm.data)
+    assert sq.end_date == dm.end_date
+    for target in (month, DateRange.to_date(NEXT_DAY)):
+        for name, getter in GETTERS.items():
+            assert_same(getter(dm, target, None), getter(sq, target, None))
+    assert_same(dm.get_retention_matrix(), sq.get_retention_matrix())
+
+@pytest.mark.parametrize('wait_model', [HourlyLoadWaitModel(), lambda df: df['age'].astype(np.int64) // 4],
+                         ids=['slot-load', 'callable'])
+def test_set_wait_model_parity(fresh_pair, wait_model):
+    dm, sq = fresh_pair
+    month = pd.Period('2026-09', 'M')
+    before = sq.get_heatmap_data(month, metric='wait_time')
+    dm.set_wait_model(wait_model)
+    sq.set_wait_model(wait_model)
+    after = sq.get_heatmap_data(month, metric='wait_time')
+    assert not after.equals(before)
+    assert_same(dm.get_heatmap_data(month, metric='wait_time'), after)
+    assert_same(dm.get_kpi_summary(month), sq.get_kpi_summary(month))
+    dm.append_day(NEXT_DAY)
+    sq.append_day(NEXT_DAY)
+    assert_same(dm.get_heatmap_data(DateRange.to_date(NEXT_DAY), metric='wait_time'),
+                sq.get_heatmap_data(DateRange.to_date(NEXT_DAY), metric='wait_time'))
+
+def test_build_takes_seed_from_source_manager(tmp_path):
+    dm = DataManager(months_back=1, seed=9, end_date=END, n_clinics=1)
+    assert SQLiteDataManager.build(tmp_path / 'a.db', dm).seed == 9
+    assert SQLiteDataManager.build(tmp_path / 'b.db', dm, seed=3).seed == 3
+
+def test_same_day_append_with_clock_times(fresh_pair):
+    """Visits stamped mid-day re-process the whole day, including its existing rows"""
+    dm, sq = fresh_pair
+    last_day = dm.data[dm.data['date'] == dm.data['date'].max()]
+    extra = last_day.head(20).drop(columns=['wait_time', 'patient_id'])
+    extra = extra.assign(date=extra['date'] + pd.Timedelta(hours=15))
+    dm.append_visits(extra)
+    sq.append_visits(extra)
+    assert sq.row_count() == len(dm.data)
+    day = dm.data[dm.data['date'] == last_day['date'].iloc[0]]
+    assert len(day) == len(last_day) + len(extra)
+    np.testing.assert_array_equal(day['wait_time'].tail(len(extra)),
+                                  dm.wait_model(day)[-len(extra):].astype(day['wait_time'].dtype))
+    month = pd.Period(last_day['date'].iloc[0], 'M')
+    assert_same(dm.get_kpi_summary(month), sq.get_kpi_summary(month))
+    assert_same(dm.get_heatmap_data(month, metric='wait_time'), sq.get_heatmap_data(month, metric='wait_time'))
+
+def test_writes_close_their_connections(fresh_pair, monkeypatch):
+    dm, sq = fresh_pair
+    opened = []
+    connect = sqlite3.connect
+    
+    def tracking_connect(database, *args, **kwargs):
+        conn = connect(database, *args, **kwargs)
+        if not kwargs.get('uri'):  # the per-thread read-only connection stays open by design
+            opened.append(conn)
+        return conn
+    
+    monkeypatch.setattr(app.sqlite3, 'connect', tracking_connect)
+    sq.append_day(NEXT_DAY)
+    sq.set_wait_model(HourlyLoadWaitModel())
+    sq.set_wait_model(lambda df: df['age'].astype(np.int64))
+    assert len(opened) == 3
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+def test_open_rejects_database_without_patient_ids(tmp_path):
+    path = tmp_path / 'old.db'
+    with sqlite3.connect(path) as conn:
+        conn.execute(f"CREATE TABLE visits ({', '.join(VISIT_DB_COLUMNS[:-1])})")
+    conn.close()
+    with pytest.raises(ValueError, match='patient_id'):
+        SQLiteDataManager(path)
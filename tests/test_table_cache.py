@@ -0,0 +1,87 @@
+"""Persistent table cache: reuse, process-independent keys, and pruning of superseded tables"""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import DataManager, HourlyLoadWaitModel, cached_table, load_table, prune_table_cache, table_cache_key
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Wait models given to the key in this process and in a fresh one
+MODELS = {
+    'default': 'None',
+    'dataclass': 'HourlyLoadWaitModel(reference_load=10)',
+    'lambda': "eval(compile('lambda df: df.age // 3', 'waits', 'eval'), {'__name__': 'waits'})"
+}
+
+def cache_key(wait_model) -> str:
+    dm = DataManager(months_back=1, seed=5, end_date=datetime(2026, 1, 15), wait_model=wait_model)
+    return table_cache_key(dm._cache_params())
+
+def small_table(n: int) -> pd.DataFrame:
+    return pd.DataFrame({'date': np.full(n, np.datetime64('2026-01-05', 'us')), 'revenue': np.arange(n, dtype=np.int32)})
+
+def test_hit_reuses_the_saved_table(tmp_path):
+    kwargs = dict(months_back=1, seed=5, end_date=datetime(2026, 1, 15))
+    first = DataManager(**kwargs, cache_dir=tmp_path)
+    again = DataManager(**kwargs, cache_dir=tmp_path)
+    assert again.data.equals(first.data)  # the second one is a memory map of the first
+    assert len(list(tmp_path.iterdir())) == 1
+
+def test_new_keys_evict_least_recently_used(tmp_path):
+    builds = []
+    
+    def build(n):
+        builds.append(n)
+        return small_table(n)
+    
+    for n in range(1, 4):
+        cached_table(tmp_path, {'n': n}, lambda: build(n), keep=2)
+        time.sleep(0.01)
+    assert sorted(d.name for d in tmp_path.iterdir()) == sorted(table_cache_key({'n': n}) for n in (2, 3))
+    
+    # A hit refreshes recency, so the next miss evicts n=3 rather than n=2
+    old = time.time() - 60
+    os.utime(tmp_path / table_cache_key({'n': 3}), (old, old))
+    cached_table(tmp_path, {'n': 2}, lambda: build(2), keep=2)
+    cached_table(tmp_path, {'n': 4}, lambda: build(4), keep=2)
+    assert builds == [1, 2, 3, 4]
+    assert load_table(tmp_path / table_cache_key({'n': 2})) is not None
+    assert load_table(tmp_path / table_cache_key({'n': 3})) is None
+
+@pytest.mark.parametrize('model', MODELS.values(), ids=MODELS.keys())
+def test_key_is_the_same_in_another_process(model):
+    script = (f"import sys; sys.path.insert(0, {str(ROOT)!r}); sys.path.insert(0, {str(ROOT / 'tests')!r})\n"
+              f"import conftest\nfrom app import HourlyLoadWaitModel\nfrom test_table_cache import cache_key\n"
+              f"print(cache_key({model}))")
+    other = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    assert other.stdout.strip() == cache_key(eval(model))
+
+def test_key_follows_wait_model_parameters_and_code():
+    assert cache_key(HourlyLoadWaitModel()) != cache_key(HourlyLoadWaitModel(reference_load=10))
+    assert cache_key(lambda df: df.age // 3) != cache_key(lambda df: df.age // 4)
+
+def test_prune_tolerates_tables_removed_concurrently(tmp_path, monkeypatch):
+    for n in range(4):
+        cached_table(tmp_path, {'n': n}, lambda: small_table(3), keep=10)
+    vanishing = tmp_path / table_cache_key({'n': 1})
+    is_dir = Path.is_dir
+    
+    def racing_is_dir(self):
+        found = is_dir(self)
+        if self == vanishing:
+            shutil.rmtree(self)  # another process prunes it between our checks
+        return found
+    
+    monkeypatch.setattr(Path, 'is_dir', racing_is_dir)
+    prune_table_cache(tmp_path, keep=2)
+    assert len(list(tmp_path.iterdir())) == 2
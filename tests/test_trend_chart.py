@@ -0,0 +1,54 @@
+"""LTTB downsampling and the long-range trend chart"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import TREND_POINT_BUDGET, TREND_SPANS, create_dual_axis_chart, lttb_indices
+
+def noisy(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.arange(n, dtype=float), np.cumsum(rng.normal(size=n))
+
+@pytest.mark.parametrize('n, n_out', [(1000, 50), (101, 10), (10, 3)])
+def test_keeps_endpoints_in_increasing_order(n, n_out):
+    x, y = noisy(n)
+    idx = lttb_indices(x, y, n_out)
+    assert len(idx) == n_out
+    assert idx[0] == 0 and idx[-1] == n - 1
+    assert (np.diff(idx) > 0).all()
+
+@pytest.mark.parametrize('n_out', [100, 150, 2])
+def test_small_inputs_pass_through(n_out):
+    x, y = noisy(100)
+    np.testing.assert_array_equal(lttb_indices(x, y, n_out), np.arange(100))
+
+def test_keeps_the_spike():
+    x = np.arange(500, dtype=float)
+    y = np.zeros(500)
+    y[237] = 50
+    assert 237 in lttb_indices(x, y, 20)
+
+def daily(n):
+    _, walk = noisy(n, seed=1)
+    return pd.DataFrame({'date': pd.date_range('2024-01-01', periods=n, freq='D'),
+                         'visits': (60 + walk).round(), 'revenue': 250_000 + 5_000 * noisy(n, seed=2)[1]})
+
+def test_long_range_traces_share_one_x_sample():
+    data = daily(900)
+    fig = create_dual_axis_chart(data)
+    visits, revenue = fig.data
+    assert visits.type == 'scattergl'
+    np.testing.assert_array_equal(visits.x, revenue.x)
+    assert len(visits.x) <= TREND_POINT_BUDGET
+    assert visits.x[0] == data['date'].iloc[0] and visits.x[-1] == data['date'].iloc[-1]
+    by_date = data.set_index('date')
+    np.testing.assert_array_equal(revenue.y, by_date.loc[pd.DatetimeIndex(revenue.x), 'revenue'])
+
+def test_short_range_is_not_downsampled():
+    fig = create_dual_axis_chart(daily(150))
+    assert fig.data[0].type == 'scatter' and len(fig.data[0].x) == 150
+
+def test_longest_offered_span_exceeds_the_budget():
+    """The downsampling path is reachable from the span selector (~26 open days a month)"""
+    assert max(TREND_SPANS) * 26 > TREND_POINT_BUDGET
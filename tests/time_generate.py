@@ -0,0 +1,45 @@
+"""
+Time the vectorized generator against the legacy per-visit loop
+
+Usage:
+    python tests/time_generate.py
+    python tests/time_generate.py --months 6 24 --repeat 3
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import DataManager  # noqa: E402
+from legacy_generator import legacy_generate_data  # noqa: E402
+
+def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), len(result)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--months', type=int, nargs='+', default=[6, 12])
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per implementation (median)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    end_date = datetime(2026, 1, 15)
+    print(f"{'months':>6} {'rows':>8} {'legacy s':>9} {'vectorized s':>13} {'speedup':>8}")
+    for months in args.months:
+        legacy, rows = timed(lambda: legacy_generate_data(months, args.seed, end_date), args.repeat)
+        dm = DataManager(months, args.seed, end_date=end_date)
+        vectorized, _ = timed(dm._generate_data, args.repeat)
+        print(f"{months:>6} {rows:>8,} {legacy:>9.3f} {vectorized:>13.3f} {legacy / vectorized:>7.0f}x")
+
+if __name__ == "__main__":
+    main()